@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+import multiprocessing as mp
+import numpy as np
+import polars as pl
+from main import (indicator_pair_grids, task_bar_sets, generate_tasks, make_company_batches,
+                  dispatch_chunksize, write_top_reports)
+from src.profiling import StageTimer
+from src.data_preprocessor import RAW_DATA_DIR, process_all_data, list_processed_companies, load_processed_data
+from src.task_runner import ENGINES, init_worker, run_company_batch
+from src.results_table import METRIC_GROUPS, ResultsWriter, set_metric_groups
+from src.report_generator import generate_leaderboard_report
+
+# Results are written next to the repository, whatever directory the data lives in
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS_DIR = os.path.join(REPO_DIR, 'results', 'benchmarks')
+
+# Dataset sizes as (symbols, trading days) of 1-minute bars
+SIZES = {
+    'smoke': (2, 21),
+    '1y-10': (10, 252),
+    '5y-10': (10, 5 * 252),
+    '20y-10': (10, 20 * 252),
+    '1y-100': (100, 252),
+    '1y-500': (500, 252),
+}
+
+# One NSE-style session per trading day: 09:15 to 15:29, one bar per minute
+SESSION_OPEN = np.timedelta64(9 * 60 + 15, 'm')
+BARS_PER_DAY = 375
+
+# Bar counts the fixed per-task overhead is measured at: a fifth of a session
+# (one day of 5-minute bars), then 1, 5 and 25 sessions of 1-minute bars
+OVERHEAD_LENGTHS = [BARS_PER_DAY // 5, BARS_PER_DAY, 5 * BARS_PER_DAY, 25 * BARS_PER_DAY]
+# Optional metric groups each overhead measurement computes
+OVERHEAD_METRICS = {
+    'all': tuple(METRIC_GROUPS),
+    **{group: (group,) for group in METRIC_GROUPS},
+    'none': (),
+}
+# Two cheap indicators, so the engine's fixed cost per task is not buried under indicator math
+OVERHEAD_TASK = ('SYN000', ('EMA', 'RSI'), {'period': 20}, {'period': 14}, 'base')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the backtesting pipeline on synthetic intraday data.")
+    parser.add_argument('--sizes', nargs='*', choices=SIZES.keys(), default=['smoke', '1y-10'],
+                        help="Dataset sizes to benchmark, as symbols x years of 1-minute bars (none to skip).")
+    parser.add_argument('--engine', choices=('backtrader', 'vectorized'), default='vectorized')
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help="Pool sizes for the full sweep (default: 1, 2, 4 and all but one core).")
+    parser.add_argument('--tasks-per-symbol', type=int, default=50,
+                        help="Evenly spaced sample of each symbol's tasks per timeframe to sweep (0 for the full grid).")
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--output', default=None,
+                        help="JSON file to write (default: results/benchmarks/benchmark_<timestamp>.json).")
+    parser.add_argument('--compare', default=None,
+                        help="Earlier benchmark JSON to print speedups against.")
+    parser.add_argument('--overhead-lengths', type=int, nargs='*', default=OVERHEAD_LENGTHS, metavar='BARS',
+                        help="Bar counts to time a single task at, to show the fixed per-task overhead (none to skip).")
+    parser.add_argument('--overhead-repeats', type=int, default=3,
+                        help="Runs of each overhead measurement; the fastest is kept.")
+    parser.add_argument('--keep-data', action='store_true',
+                        help="Keep the generated working directory instead of deleting it.")
+    return parser.parse_args()
+
+def generate_intraday_csvs(raw_dir, symbols, days, seed=0):
+    """Writes one random-walk 1-minute OHLCV CSV per symbol and returns the total bar count."""
+    os.makedirs(raw_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    sessions = np.busday_offset('2005-01-03', np.arange(days)).astype('datetime64[m]')
+    minutes = SESSION_OPEN + np.arange(BARS_PER_DAY).astype('timedelta64[m]')
+    datetimes = (sessions[:, None] + minutes[None, :]).ravel().astype('datetime64[us]')
+    n = len(datetimes)
+
+    for i in range(symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.0005, n)))
+        open_ = np.concatenate(([100.0], close[:-1]))
+        spread = np.abs(rng.normal(0, 0.0003, (2, n))) * close
+        pl.DataFrame({
+            'Date': datetimes,
+            'Open': open_,
+            'High': np.maximum(open_, close) + spread[0],
+            'Low': np.minimum(open_, close) - spread[1],
+            'Close': close,
+            'Volume': rng.integers(100, 10000, n),
+        }).with_columns(pl.col('Date').dt.strftime('%Y-%m-%d %H:%M:%S')).write_csv(
+            os.path.join(raw_dir, f"SYN{i:03d}.csv")
+        )
+    return n * symbols
+
+def sample_tasks(tasks, per_symbol):
+    """Keeps an evenly spaced sample of per_symbol tasks for every company at every timeframe."""
+    if per_symbol <= 0:
+        return tasks
+    by_bars = {}
+    for task in tasks:
+        by_bars.setdefault((task[0], task[4]), []).append(task)
+    sampled = []
+    for bar_tasks in by_bars.values():
+        step = max(1, len(bar_tasks) // per_symbol)
+        sampled.extend(bar_tasks[::step][:per_symbol])
+    return sampled
+
+def timed(timer, stage, func, *args):
+    with timer.stage(stage):
+        return func(*args)
+
+def run_sweep(engine_name, tasks, workers, batch_size, results_path):
+    """Runs tasks on a pool of `workers` processes, writing their records to results_path."""
+    batches = list(make_company_batches(tasks, engine_name, batch_size, {}))
+    errors = 0
+    start = time.perf_counter()
+    with ResultsWriter(results_path) as writer:
+        # Same worker start-up as main.run_batches: the initializer imports the engine up front
+        with mp.get_context('spawn').Pool(processes=workers, initializer=init_worker, initargs=(engine_name,)) as pool:
+            chunksize = dispatch_chunksize(len(batches), workers)
+            for results, _ in pool.imap_unordered(run_company_batch, batches, chunksize=chunksize):
+                writer.add(record for _, record in results)
+                errors += sum(record['status'] != 'Completed' for _, record in results)
+    wall = time.perf_counter() - start
+    return {'workers': workers, 'tasks': len(tasks), 'batches': len(batches), 'errors': errors,
+            'wall_s': wall, 'tasks_per_s': len(tasks) / wall if wall > 0 else None}
+
+def time_task(engine_name, task, prepared, metric_groups, repeats):
+    """Fastest wall time of one task on prepared bars, computing only the given metric groups."""
+    engine = ENGINES[engine_name]
+    cache = getattr(engine, 'indicator_cache', None)
+    set_metric_groups(metric_groups)
+    best = float('inf')
+    try:
+        for _ in range(repeats):
+            if cache is not None:
+                # Every repeat computes its indicators again, as a new task would
+                cache.clear()
+            start = time.perf_counter()
+            record = engine.run_backtest_task(task, prepared)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        set_metric_groups(METRIC_GROUPS)
+    if record['status'] != 'Completed':
+        raise RuntimeError(record['message'])
+    return best
+
+def _first_task_seconds(args):
+    """Pool task: wall time of the first task a fresh worker runs, including any imports it still needs."""
+    engine_name, task, data = args
+    start = time.perf_counter()
+    engine = ENGINES[engine_name]
+    engine.run_backtest_task(task, engine.prepare_data(data))
+    return time.perf_counter() - start
+
+def time_first_task(engine_name, task, data, warm):
+    """
+    Seconds from starting a one-worker spawn pool, with (warm) or without the
+    init_worker initializer, to its first task's result, so the worker's
+    start-up and initializer count in both modes. Returns (total, task) where
+    task is the time the first task itself took inside the worker.
+    """
+    pool_args = {'initializer': init_worker, 'initargs': (engine_name,)} if warm else {}
+    start = time.perf_counter()
+    with mp.get_context('spawn').Pool(processes=1, **pool_args) as pool:
+        task_seconds = pool.apply(_first_task_seconds, ((engine_name, task, data),))
+        return time.perf_counter() - start, task_seconds
+
+def benchmark_overhead(args):
+    """
+    Times one cheap task at every length in args.overhead_lengths, once per
+    metric set, and fits time = fixed + per_bar * bars to each. `fixed` is
+    what every task pays however short its bars are: for Backtrader, the
+    Cerebro, feed, strategy and analyzers it builds. Also times a fresh
+    pool's first result with and without the worker initializer.
+    """
+    lengths = sorted(args.overhead_lengths)
+    print(f"=== Per-task overhead: {args.engine} engine at {', '.join(map(str, lengths))} bars ===")
+    generate_intraday_csvs(RAW_DATA_DIR, 1, -(-lengths[-1] // BARS_PER_DAY))
+    process_all_data()
+    data, _ = load_processed_data(OVERHEAD_TASK[0])
+    engine = ENGINES[args.engine]
+
+    per_task = {name: [] for name in OVERHEAD_METRICS}
+    for length in lengths:
+        prepared = engine.prepare_data(data.head(length))
+        for name, groups in OVERHEAD_METRICS.items():
+            per_task[name].append(time_task(args.engine, OVERHEAD_TASK, prepared, groups, args.overhead_repeats))
+
+    fits = {}
+    for name, seconds in per_task.items():
+        # Weighted by 1/time, so the short series that expose the fixed cost count as much as the long ones
+        per_bar, fixed = np.polyfit(lengths, seconds, 1, w=1 / np.array(seconds)) if len(lengths) > 1 else (0.0, seconds[0])
+        fits[name] = {'fixed_ms': fixed * 1e3, 'per_bar_us': per_bar * 1e6}
+
+    first_task_data = data.head(lengths[0])
+    cold_s, cold_task_s = time_first_task(args.engine, OVERHEAD_TASK, first_task_data, warm=False)
+    warm_s, warm_task_s = time_first_task(args.engine, OVERHEAD_TASK, first_task_data, warm=True)
+    first_task = {'cold_s': cold_s, 'cold_task_s': cold_task_s, 'warm_s': warm_s, 'warm_task_s': warm_task_s}
+    shutil.rmtree('data')
+    return {'lengths': lengths, 'per_task_s': per_task, 'fits': fits, 'first_task': first_task}
+
+def print_overhead(overhead):
+    lengths = overhead['lengths']
+    print("Per-task ms by bars and metrics computed:")
+    print(f"  {'metrics':<10}" + ''.join(f"{n:>10}" for n in lengths) + f"{'fixed ms':>11}{'us/bar':>9}")
+    for name, seconds in overhead['per_task_s'].items():
+        fit = overhead['fits'][name]
+        print(f"  {name:<10}" + ''.join(f"{t * 1e3:10.2f}" for t in seconds)
+              + f"{fit['fixed_ms']:11.2f}{fit['per_bar_us']:9.2f}")
+    first = overhead['first_task']
+    print(f"Pool start to first result: {first['cold_s'] * 1e3:.0f} ms cold "
+          f"(task {first['cold_task_s'] * 1e3:.0f} ms), {first['warm_s'] * 1e3:.0f} ms with init_worker "
+          f"(task {first['warm_task_s'] * 1e3:.0f} ms)")
+
+def benchmark_size(name, args, workers_list):
+    """Runs every stage for one dataset size inside the current working directory."""
+    symbols, days = SIZES[name]
+    print(f"=== {name}: {symbols} symbols x {days} days of 1-minute bars ===")
+    timer = StageTimer()
+    bars = timed(timer, 'generate', generate_intraday_csvs, RAW_DATA_DIR, symbols, days)
+    timed(timer, 'preprocess', process_all_data)
+    # Second pass measures the manifest check that skips unchanged files
+    timed(timer, 'preprocess_unchanged', process_all_data)
+
+    companies = list_processed_companies()
+    with timer.stage('generate_tasks'):
+        all_tasks = list(generate_tasks(task_bar_sets(companies), indicator_pair_grids()))
+    engine = ENGINES[args.engine]
+    single = engine.run_single_backtest if args.engine == 'backtrader' else engine.run_vectorized_backtest
+    record = timed(timer, 'single_backtest', single, all_tasks[0])
+
+    tasks = sample_tasks(all_tasks, args.tasks_per_symbol)
+    sweeps = []
+    for workers in workers_list:
+        print(f"--- Sweeping {len(tasks)} tasks on {workers} workers ---")
+        sweeps.append(run_sweep(args.engine, tasks, workers, args.batch_size, 'results/benchmark.parquet'))
+
+    with timer.stage('report'):
+        generate_leaderboard_report('results/benchmark.parquet', 'results/leaderboard.html')
+        write_top_reports('results/benchmark.parquet', 10)
+
+    shutil.rmtree('data')
+    return {
+        'size': name,
+        'symbols': symbols,
+        'days': days,
+        'bars': bars,
+        'total_tasks': len(all_tasks),
+        'single_backtest_status': record['status'],
+        'stages': {stage: {'wall_s': wall, 'cpu_s': cpu} for stage, (wall, cpu) in timer.totals.items()},
+        'sweeps': sweeps,
+    }
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+def compare(report, baseline_path):
+    """Prints the speedup of every stage and sweep against an earlier benchmark file."""
+    with open(baseline_path) as f:
+        old_report = json.load(f)
+    baseline = {size['size']: size for size in old_report['sizes']}
+    print(f"--- Speedup against {baseline_path} (>1 is faster) ---")
+    for size in report['sizes']:
+        old = baseline.get(size['size'])
+        if old is None:
+            continue
+        for stage, t in size['stages'].items():
+            if stage in old['stages'] and t['wall_s'] > 0:
+                print(f"  {size['size']:<8} {stage:<22} {old['stages'][stage]['wall_s'] / t['wall_s']:6.2f}x")
+        old_sweeps = {s['workers']: s for s in old['sweeps']}
+        for sweep in size['sweeps']:
+            prev = old_sweeps.get(sweep['workers'])
+            if prev and prev['tasks_per_s'] and sweep['tasks_per_s']:
+                label = f"sweep x{sweep['workers']}"
+                print(f"  {size['size']:<8} {label:<22} {sweep['tasks_per_s'] / prev['tasks_per_s']:6.2f}x")
+    if 'overhead' in report and 'overhead' in old_report:
+        old_fits = old_report['overhead']['fits']
+        for name, fit in report['overhead']['fits'].items():
+            if name in old_fits and fit['fixed_ms'] > 0:
+                label = f"fixed/task {name}"
+                print(f"  {'overhead':<8} {label:<22} {old_fits[name]['fixed_ms'] / fit['fixed_ms']:6.2f}x")
+
+def main():
+    args = parse_args()
+    cores = mp.cpu_count()
+    workers_list = sorted(set(args.workers or [w for w in (1, 2, 4, max(1, cores - 1)) if w <= cores]))
+    output = args.output or os.path.join(BENCHMARKS_DIR, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    output = os.path.abspath(output)
+
+    # The pipeline reads and writes relative data/ and results/ paths, so it
+    # runs inside a scratch directory and never touches the real datasets
+    workdir = tempfile.mkdtemp(prefix='backtest_bench_')
+    os.chdir(workdir)
+    report = {
+        'commit': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'engine': args.engine,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': cores,
+        'tasks_per_symbol': args.tasks_per_symbol,
+        'sizes': [],
+    }
+    try:
+        for name in args.sizes:
+            report['sizes'].append(benchmark_size(name, args, workers_list))
+        if args.overhead_lengths:
+            report['overhead'] = benchmark_overhead(args)
+    finally:
+        os.chdir(REPO_DIR)
+        if args.keep_data:
+            print(f"Benchmark data kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved to {output}")
+
+    for size in report['sizes']:
+        print(f"{size['size']}: " + ", ".join(
+            f"{stage} {t['wall_s']:.2f}s" for stage, t in size['stages'].items()))
+        for sweep in size['sweeps']:
+            print(f"  {sweep['workers']:>3} workers: {sweep['tasks_per_s']:.1f} tasks/sec")
+    if 'overhead' in report:
+        print_overhead(report['overhead'])
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,384 @@
 import os
+import json
+import time
+import argparse
+from datetime import datetime
 from itertools import combinations
 import multiprocessing as mp
-from src.backtesting_engine import run_single_backtest
-from src.config import INDICATORS, get_param_combinations
-from src.data_preprocessor import process_all_data
+import polars as pl
+from src.config import INDICATORS, TIMEFRAMES, get_param_combinations
+from src.data_preprocessor import process_all_data, list_processed_companies, processed_fingerprint, available_timeframes
+from src.task_runner import ENGINES, STAGES, init_worker, run_company_batch
+from src.shared_data import SharedDataStore
+from src.result_store import RESULTS_DB, ResultStore, engine_settings, task_hash
+from src.results_table import SELECTION_METRICS, METRIC_GROUPS, ResultsWriter
+from src.walk_forward import WALK_FORWARD_SCHEMA, make_fold_batches, run_fold, summarize
+from src.optimizer import DEFAULT_RUNGS, DEFAULT_KEEP, make_rung_batches, run_rung_batch, survivors
+from src.task_queue import LEASE_SECONDS, TaskQueue, run_worker
+from src.profiling import RunProfile, StageTimer
+from src.report_generator import generate_html_report, generate_leaderboard_report
+
+# Each run writes its results table and leaderboard to a timestamped folder here
+RUNS_DIR = 'results/runs'
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the intraday indicator-pair backtesting suite.")
+    parser.add_argument('--engine', choices=ENGINES.keys(), default='backtrader',
+                        help="'backtrader' runs each task bar by bar, 'vectorized' uses NumPy arrays.")
+    parser.add_argument('--metrics', nargs='*', choices=METRIC_GROUPS.keys(), default=list(METRIC_GROUPS), metavar='GROUP',
+                        help="Optional metrics to compute: trades, sharpe, drawdown (default: all). Final value and PNL "
+                             "always are; each group left out is one Backtrader analyzer less per task.")
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help="Maximum tasks per worker batch. Each batch loads one company's bars at one timeframe once.")
+    parser.add_argument('--shared-memory', action='store_true',
+                        help="Publish each company's OHLCV arrays once in shared memory for all workers. Needs "
+                             "--engine vectorized: Backtrader workers would still build their own Pandas copy each.")
+    parser.add_argument('--results-db', default=RESULTS_DB,
+                        help="SQLite store of finished tasks, used to resume interrupted runs.")
+    parser.add_argument('--rerun', action='store_true',
+                        help="Run every task again, even if the result store says it already finished.")
+    parser.add_argument('--top-n-reports', type=int, default=10,
+                        help="Write a detailed HTML report for the N best tasks by PNL (0 for none).")
+    parser.add_argument('--instrument', action='store_true',
+                        help="Time every task's stages (wall and CPU), track worker RSS and write profile.json for the run.")
+    parser.add_argument('--profile', type=int, nargs='?', const=10, default=0, metavar='N',
+                        help="Write cProfile stats for about N evenly spaced tasks (default 10). Implies --instrument.")
+    parser.add_argument('--optimize', action='store_true',
+                        help="Successive halving: run every task on a short recent slice, keep the best and re-run them on more data.")
+    parser.add_argument('--sh-rungs', type=float, nargs='+', default=list(DEFAULT_RUNGS), metavar='FRACTION',
+                        help="Share of each bar set's history per rung, ending with 1.0 (default 0.125 0.25 0.5 1.0).")
+    parser.add_argument('--sh-keep', type=float, default=DEFAULT_KEEP,
+                        help="Share of each bar set's tasks promoted to the next rung (default 0.5).")
+    parser.add_argument('--sh-metric', choices=SELECTION_METRICS, default='pnl',
+                        help="Metric tasks are ranked by between rungs.")
+    parser.add_argument('--queue', default=None, metavar='PATH',
+                        help="Coordinator mode: write the batches to this SQLite queue for worker.py processes on any host, "
+                             "and collect their results instead of running a local pool.")
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help="Queue workers the coordinator starts on this machine (default 0: only external workers).")
+    parser.add_argument('--lease-seconds', type=float, default=LEASE_SECONDS,
+                        help="How long a queue batch stays with a worker that stops renewing it before it is retried.")
+    parser.add_argument('--portfolio', nargs='*', default=None, metavar='SYMBOL',
+                        help="Portfolio mode: backtest every task on these companies together (all processed companies "
+                             "if none are given), sharing one cash balance. Runs on the backtrader engine.")
+    parser.add_argument('--allocation', type=float, default=None,
+                        help="Share of portfolio value in (0, 1] each new position may take (default: 1/N of N companies).")
+    parser.add_argument('--walk-forward', action='store_true',
+                        help="Pick parameters on rolling train windows and score them on the following test window.")
+    parser.add_argument('--train-months', type=int, default=3,
+                        help="Calendar months in each walk-forward train window.")
+    parser.add_argument('--test-months', type=int, default=1,
+                        help="Calendar months in each walk-forward test window; folds roll forward by this much.")
+    parser.add_argument('--wf-metric', choices=SELECTION_METRICS, default='pnl',
+                        help="Train-window metric used to pick each pair's parameters.")
+    args = parser.parse_args()
+    if args.portfolio is not None and args.engine != 'backtrader':
+        parser.error("--portfolio runs on the backtrader engine only")
+    if args.allocation is not None and not 0 < args.allocation <= 1:
+        parser.error("--allocation must be a share of portfolio value in (0, 1]")
+    if args.shared_memory and args.engine != 'vectorized':
+        parser.error("--shared-memory only saves memory with --engine vectorized")
+    modes = [option for option, chosen in (
+        ('--optimize', args.optimize), ('--queue', args.queue), ('--walk-forward', args.walk_forward),
+        ('--portfolio', args.portfolio is not None),
+    ) if chosen]
+    if len(modes) > 1:
+        parser.error(f"{', '.join(modes)} cannot be combined; pick one run mode")
+    rungs = args.sh_rungs
+    if any(not 0 < f <= 1 for f in rungs) or any(a >= b for a, b in zip(rungs, rungs[1:])) or rungs[-1] != 1.0:
+        parser.error("--sh-rungs must be fractions in (0, 1], strictly increasing and ending with 1.0")
+    if not 0 < args.sh_keep <= 1:
+        parser.error("--sh-keep must be in (0, 1]")
+    for option, metric in (('--sh-metric', args.sh_metric), ('--wf-metric', args.wf_metric)):
+        if metric == 'sharpe' and 'sharpe' not in args.metrics:
+            parser.error(f"{option} sharpe needs the sharpe metrics (--metrics ... sharpe)")
+    return args
+
+def indicator_pair_grids():
+    """
+    (indicator pair, [(params1, params2), ...]) for every pair of indicators,
+    with each indicator's parameter combinations expanded once per run.
+    """
+    params = {name: list(get_param_combinations(name)) for name in INDICATORS}
+    grids = []
+    for ind1_name, ind2_name in combinations(INDICATORS, 2):
+        grids.append(((ind1_name, ind2_name), [
+            (p1, p2) for p1 in params[ind1_name] for p2 in params[ind2_name]
+            # Avoid backtesting an indicator against itself if it has no params
+            if not (ind1_name == ind2_name and p1 == p2)
+        ]))
+    return grids
+
+def task_bar_sets(companies):
+    """(company, timeframe) for each timeframe in TIMEFRAMES a company has bars for."""
+    return [(company, tf) for company in companies for tf in available_timeframes(company) if tf in TIMEFRAMES]
+
+def count_tasks(bar_sets, pair_grids):
+    """Number of tasks generate_tasks yields, without generating them."""
+    return len(bar_sets) * sum(len(grid) for _, grid in pair_grids)
+
+def generate_tasks(bar_sets, pair_grids):
+    """
+    Lazily yields every (company, indicator pair, params1, params2, timeframe)
+    task of the sweep, one bar set at a time, so batches can be dispatched
+    while later tasks are still being generated.
+    """
+    for company, timeframe in bar_sets:
+        for pair, grid in pair_grids:
+            for p1, p2 in grid:
+                yield company, pair, p1, p2, timeframe
+
+def dispatch_chunksize(num_batches, num_processes):
+    """Batches handed to a worker per pool round trip, as Pool.map picks it: about four chunks per worker."""
+    chunksize, extra = divmod(num_batches, num_processes * 4)
+    return max(1, chunksize + bool(extra))
+
+def make_company_batches(tasks, engine_name, batch_size, shared_handles, instrument=None):
+    """
+    Groups tasks by company and timeframe into batches of at most batch_size
+    tasks, each carrying the shared memory handle of those bars if they were
+    published and, for instrumented runs, the run-wide index of its first task.
+    Batches are yielded as soon as they fill, so only one partial batch per
+    bar set is held at a time; generate_tasks yields one bar set at a time.
+    """
+    open_batches = {}
+    offset = 0
+
+    def flush(key):
+        nonlocal offset
+        batch = open_batches.pop(key)
+        batch_instrument = None if instrument is None else dict(instrument, offset=offset)
+        offset += len(batch)
+        return engine_name, key[0], key[1], batch, shared_handles.get(key), batch_instrument
+
+    for task in tasks:
+        key = (task[0], task[4])
+        batch = open_batches.setdefault(key, [])
+        batch.append(task)
+        if len(batch) == batch_size:
+            yield flush(key)
+    for key in list(open_batches):
+        yield flush(key)
+
+def run_batches(batches, num_batches, engine_name, metric_groups, total_tasks, store, task_key, writer, profile):
+    """
+    Runs task batches on a process pool, printing progress and saving every
+    batch's records to the result store and the run's results table.
+    batches may be a lazy iterator; the pool starts on the first ones while
+    later ones are still being built. num_batches only tunes the chunksize.
+    Workers compute the given optional metric groups.
+    Each batch's stage timings are added to profile.
+    """
+    # 4. Run tasks in parallel using a process pool
+    # Use one less than the total number of CPU cores to keep the system responsive
+    num_processes = max(1, mp.cpu_count() - 1)
+    print(f"--- Starting {engine_name} Backtests on {num_processes} cores ---")
+    
+    # Polars' thread pool does not survive fork(), so workers are spawned fresh,
+    # and import the engine and its indicators before their first batch
+    with mp.get_context('spawn').Pool(processes=num_processes, initializer=init_worker,
+                                      initargs=(engine_name, metric_groups)) as pool:
+        # Use imap_unordered for better progress visibility
+        done = 0
+        chunksize = dispatch_chunksize(num_batches, num_processes)
+        for results, stats in pool.imap_unordered(run_company_batch, batches, chunksize=chunksize):
+            profile.add(stats)
+            store.record([(task_key(task), record) for task, record in results], engine_name)
+            writer.add(record for _, record in results)
+            for _, record in results:
+                done += 1
+                # Print progress and any errors
+                print(f"Progress: {done}/{total_tasks} -> {record['message']}")
+
+def run_coordinator(args, batches, total_tasks, store, task_key, writer):
+    """
+    Writes the batches to the durable queue at args.queue and collects the
+    records workers push back, until every task has a record or no batch
+    is pending or leased. Workers
+    are worker.py processes on any host that sees the queue file and the
+    processed data; args.local_workers of them are started here.
+    Tasks the queue already holds (pending, leased or completed, e.g. when
+    the coordinator itself was restarted) are not queued again, and only
+    the records of this sweep's tasks are collected, once per task.
+    """
+    keys = set()
+
+    def keyed(batches):
+        for engine_name, company, timeframe, tasks, _, _ in batches:
+            batch_keys = [task_key(t) for t in tasks]
+            keys.update(batch_keys)
+            yield engine_name, company, timeframe, tasks, batch_keys
+
+    with TaskQueue(args.queue) as queue:
+        added = queue.enqueue(keyed(batches), args.metrics)
+        print(f"Queued {added} new batches in {args.queue}: {queue.counts()}")
+
+        workers = [
+            mp.get_context('spawn').Process(target=run_worker, args=(args.queue, None, args.lease_seconds))
+            for _ in range(args.local_workers)
+        ]
+        for worker in workers:
+            worker.start()
+        print(f"--- Coordinating {args.engine} Backtests: {len(workers)} local workers, "
+              f"start more with: python worker.py --queue {args.queue} ---")
+
+        done, last_row = 0, 0
+        collected = set()
+        while True:
+            counts = queue.counts()
+            # Batches abandoned on their last attempt are recorded as errors
+            queue.reap()
+            rows = []
+            for last_row, key, record in queue.results_after(last_row):
+                # Skip other sweeps' results and any task already collected
+                if key in keys and key not in collected:
+                    collected.add(key)
+                    rows.append((key, record))
+            if rows:
+                store.record(rows, args.engine)
+                writer.add(record for _, record in rows)
+                for _, record in rows:
+                    done += 1
+                    print(f"Progress: {done}/{total_tasks} -> {record['message']}")
+            if len(collected) == len(keys) or (counts['pending'] == 0 and counts['leased'] == 0):
+                break
+            time.sleep(1)
+
+        for worker in workers:
+            worker.join()
+        print(f"--- Queue Drained: {counts['done']} batches done, {counts['failed']} failed ---")
+
+def run_walk_forward(args, bar_sets, pair_grids):
+    """
+    Runs every (company, timeframe, fold) on a process pool and writes one out-of-sample
+    record per indicator pair and fold. Walk-forward results are not kept in
+    the result store, since they depend on the fold layout as well as the task.
+    """
+    run_dir = os.path.join(RUNS_DIR, datetime.now().strftime('%Y%m%d_%H%M%S'))
+    results_path = os.path.join(run_dir, 'walk_forward.parquet')
+    batches = list(make_fold_batches(bar_sets, pair_grids, args.engine,
+                                     args.train_months, args.test_months, args.wf_metric))
+    if not batches:
+        print(f"No company has more than {args.train_months} months of data; nothing to walk forward.")
+        return
+
+    num_processes = max(1, mp.cpu_count() - 1)
+    print(f"--- Starting {args.engine} Walk-Forward on {len(batches)} folds, {num_processes} cores ---")
+    with ResultsWriter(results_path, schema=WALK_FORWARD_SCHEMA) as writer:
+        with mp.get_context('spawn').Pool(processes=num_processes, initializer=init_worker,
+                                          initargs=(args.engine, args.metrics)) as pool:
+            for done, records in enumerate(pool.imap_unordered(run_fold, batches), 1):
+                writer.add(records)
+                r = records[0]
+                print(f"Progress: {done}/{len(batches)} -> fold {r['fold']} of {r['company']} {r['timeframe']} "
+                      f"(test from {r['test_start']:%Y-%m-%d})")
+
+    print("--- Walk-Forward Finished ---")
+    print(f"Out-of-sample results by indicator pair (train {args.train_months}m, test {args.test_months}m, "
+          f"selected by {args.wf_metric}):")
+    with pl.Config(tbl_rows=20, tbl_cols=-1):
+        print(summarize(results_path).head(20))
+    print(f"Fold results have been recorded in {results_path}.")
+
+def run_portfolio(args, companies, pair_grids):
+    """
+    Runs every indicator pair and parameter set once per timeframe on all the
+    portfolio's companies at once. Each worker batch loads the companies'
+    bars as one aligned block. Portfolio results are not kept in the result
+    store, since they depend on the whole basket as well as the task.
+    """
+    # Imported here, since it loads Backtrader, which no other mode's driver needs
+    from src.portfolio import make_portfolio_batches, run_portfolio_batch
+
+    run_dir = os.path.join(RUNS_DIR, datetime.now().strftime('%Y%m%d_%H%M%S'))
+    results_path = os.path.join(run_dir, 'portfolio.parquet')
+    timeframes = [tf for tf in TIMEFRAMES if any(tf in available_timeframes(c) for c in companies)]
+    batches = list(make_portfolio_batches(companies, timeframes, pair_grids, max(1, args.batch_size), args.allocation))
+    total_tasks = sum(len(tasks) for _, _, tasks, _ in batches)
+
+    num_processes = max(1, mp.cpu_count() - 1)
+    print(f"--- Starting Portfolio Backtests of {len(companies)} companies on {num_processes} cores ---")
+    with ResultsWriter(results_path) as writer:
+        with mp.get_context('spawn').Pool(processes=num_processes, initializer=init_worker,
+                                          initargs=('backtrader', args.metrics)) as pool:
+            done = 0
+            for results in pool.imap_unordered(run_portfolio_batch, batches):
+                writer.add(record for _, record in results)
+                for _, record in results:
+                    done += 1
+                    print(f"Progress: {done}/{total_tasks} -> {record['message']}")
+
+    with open(os.path.join(run_dir, 'portfolio.json'), 'w') as f:
+        json.dump({'companies': companies, 'allocation': args.allocation}, f, indent=2)
+    leaderboard_path = os.path.join(run_dir, 'leaderboard.html')
+    generate_leaderboard_report(results_path, leaderboard_path)
+    print("--- Portfolio Backtests Finished ---")
+    print(f"Results have been recorded in {results_path}; leaderboard saved to {leaderboard_path}.")
+
+def run_optimizer(args, tasks, store, task_key, writer):
+    """
+    Successive halving over the task list. Every rung runs the surviving
+    tasks on the most recent args.sh_rungs[i] share of their bars, and only
+    the best args.sh_keep of each company and timeframe go on to the next.
+    The last rung runs on all the data, so its records are ordinary results
+    and go to the result store and the run's results table.
+    Returns the number of tasks that never ran on the full data.
+    """
+    rungs = sorted(args.sh_rungs)
+    if rungs[-1] != 1.0:
+        rungs.append(1.0)
+    num_processes = max(1, mp.cpu_count() - 1)
+    batch_size = max(1, args.batch_size)
+    alive = tasks
+    # Work done, in units of one task on a full bar set
+    cost = 0.0
+
+    with mp.get_context('spawn').Pool(processes=num_processes, initializer=init_worker,
+                                      initargs=(args.engine, args.metrics)) as pool:
+        for rung, fraction in enumerate(rungs, 1):
+            final = fraction == 1.0
+            print(f"--- Rung {rung}/{len(rungs)}: {len(alive)} tasks on the last {fraction * 100:g}% of each bar set ---")
+            results = []
+            batches = make_rung_batches(alive, args.engine, batch_size, fraction)
+            for batch_results in pool.imap_unordered(run_rung_batch, batches):
+                results.extend(batch_results)
+                print(f"Progress: {len(results)}/{len(alive)} -> {batch_results[-1][1]['message']}")
+            cost += fraction * len(alive)
+            if final:
+                store.record([(task_key(task), record) for task, record in results], args.engine)
+                writer.add(record for _, record in results)
+                break
+            alive = survivors(results, args.sh_keep, args.sh_metric)
+
+    skipped = len(tasks) - len(alive)
+    print(f"--- Optimizer Finished: {len(alive)} of {len(tasks)} tasks ran on the full data, {skipped} skipped ---")
+    print(f"Work done: {cost:,.0f} full-task equivalents ({cost / len(tasks):.0%} of a full sweep)")
+    return skipped
+
+def write_top_reports(results_path, top_n):
+    """Writes the per-task HTML report for the top_n completed tasks by PNL."""
+    if top_n <= 0:
+        return
+    best = (
+        pl.scan_parquet(results_path)
+        .filter(pl.col('status') == 'Completed')
+        .sort('pnl', descending=True, nulls_last=True)
+        .head(top_n)
+        .collect()
+    )
+    for r in best.iter_rows(named=True):
+        generate_html_report(
+            company=r['company'], ind1_name=r['ind1_name'], ind2_name=r['ind2_name'],
+            params1=json.loads(r['params1']), params2=json.loads(r['params2']),
+            final_value=r['final_value'], pnl=r['pnl'], total_trades=r['total_trades'],
+            wins=r['wins'], losses=r['losses'], sharpe=r['sharpe'], max_dd=r['max_drawdown'],
+            timeframe=r['timeframe'],
+        )
+    print(f"Detailed reports for the top {best.height} tasks have been saved to the /reports directory.")
 
 def main():
     """Main function to orchestrate the backtesting process."""
+    args = parse_args()
 
     # 1. Pre-process data to ensure it's up to date
     print("--- Starting Data Pre-processing ---")
@@ -14,51 +386,110 @@ def main():
     print("--- Data Pre-processing Finished ---")
 
     # 2. Get list of companies from processed data
-    processed_dir = 'data/processed'
-    if not os.path.exists(processed_dir) or not os.listdir(processed_dir):
+    companies = list_processed_companies()
+    if not companies:
         print("No processed data found. Please add raw CSV data to 'data/raw' and run again.")
         return
-        
-    companies = [f.split('.')[0] for f in os.listdir(processed_dir) if f.endswith('.parquet')]
-    indicator_names = list(INDICATORS.keys())
-    indicator_pairs = list(combinations(indicator_names, 2))
 
-    tasks = []
-    
-    # 3. Create a list of all backtesting tasks
+    # 3. Work out the sweep; tasks themselves are generated lazily as they are dispatched
     print("--- Generating Backtest Tasks ---")
-    for company in companies:
-        for ind1_name, ind2_name in indicator_pairs:
-            params1_list = list(get_param_combinations(ind1_name))
-            params2_list = list(get_param_combinations(ind2_name))
-            
-            # Create a task for each combination of parameters
-            for p1 in params1_list:
-                for p2 in params2_list:
-                    # Avoid backtesting an indicator against itself if it has no params
-                    if ind1_name == ind2_name and p1 == p2:
-                        continue
-                    tasks.append((company, (ind1_name, ind2_name), p1, p2))
-
-    if not tasks:
+    bar_sets = task_bar_sets(companies)
+    pair_grids = indicator_pair_grids()
+    total_tasks = count_tasks(bar_sets, pair_grids)
+
+    if not total_tasks:
         print("No tasks generated. Check your config.py for parameter grids.")
         return
 
-    print(f"Total tasks to run: {len(tasks)}")
-    
-    # 4. Run tasks in parallel using a process pool
-    # Use one less than the total number of CPU cores to keep the system responsive
-    num_processes = max(1, mp.cpu_count() - 1)
-    print(f"--- Starting Backtests on {num_processes} cores ---")
-    
-    with mp.Pool(processes=num_processes) as pool:
-        # Use imap_unordered for better progress visibility
-        for i, result in enumerate(pool.imap_unordered(run_single_backtest, tasks), 1):
-            # Print progress and any errors
-            print(f"Progress: {i}/{len(tasks)} -> {result}")
+    if args.walk_forward:
+        # Each fold searches the full grid of every pair
+        run_walk_forward(args, bar_sets, pair_grids)
+        return
+
+    if args.portfolio is not None:
+        missing = sorted(set(args.portfolio) - set(companies))
+        if missing:
+            print(f"No processed data for {', '.join(missing)}.")
+            return
+        run_portfolio(args, args.portfolio or companies, pair_grids)
+        return
+
+    # Skip tasks the result store already finished on identical data and settings
+    fingerprints = {(c, tf): processed_fingerprint(c, tf) for c, tf in bar_sets}
+    settings = engine_settings(args.engine, args.metrics)
 
+    def task_key(task):
+        return task_hash(task, fingerprints[(task[0], task[4])], settings)
+
+    run_dir = os.path.join(RUNS_DIR, datetime.now().strftime('%Y%m%d_%H%M%S'))
+    results_path = os.path.join(run_dir, 'results.parquet')
+    profile = RunProfile(STAGES)
+    instrument = None
+    if args.instrument or args.profile:
+        instrument = {'profile_dir': os.path.join(run_dir, 'profiles'), 'profile_every': 0}
+
+    tasks = generate_tasks(bar_sets, pair_grids)
+    tasks_to_run = total_tasks
+    with ResultStore(args.results_db) as results_store, ResultsWriter(results_path) as writer:
+        if args.optimize:
+            # Halving ranks the whole population, so finished tasks are not skipped
+            run_optimizer(args, list(tasks), results_store, task_key, writer)
+        else:
+            if not args.rerun:
+                finished = results_store.finished()
+                resumed = []
+                if finished:
+                    # One pass over the keys up front; only the finished ones are kept
+                    resumed = [key for key in map(task_key, generate_tasks(bar_sets, pair_grids)) if key in finished]
+                if resumed:
+                    tasks = (task for task in tasks if task_key(task) not in finished)
+                tasks_to_run = total_tasks - len(resumed)
+                print(f"Resuming: {len(resumed)} of {total_tasks} tasks already finished")
+                # Earlier results still belong in this run's table and leaderboard
+                writer.add(results_store.records(resumed))
+
+            if tasks_to_run:
+                print(f"Total tasks to run: {tasks_to_run}")
+                with SharedDataStore() as store:
+                    if args.shared_memory:
+                        store.publish(bar_sets)
+                        print(f"Published {len(store.handles)} bar sets to shared memory ({store.nbytes / 1e6:.1f} MB)")
+                    if args.profile:
+                        # Evenly spaced sample, so every company and indicator pair can show up
+                        instrument['profile_every'] = max(1, tasks_to_run // args.profile)
+                    batch_size = max(1, args.batch_size)
+                    batches = make_company_batches(tasks, args.engine, batch_size, store.handles, instrument)
+                    if args.queue:
+                        run_coordinator(args, batches, tasks_to_run, results_store, task_key, writer)
+                    else:
+                        # Lower bound; partial batches at the end of each bar set add a few more
+                        num_batches = -(-tasks_to_run // batch_size)
+                        run_batches(batches, num_batches, args.engine, args.metrics, tasks_to_run, results_store, task_key, writer, profile)
+            else:
+                print("--- Nothing left to run ---")
+
+    profile.finish()
     print("--- All Backtests Finished ---")
-    print("Reports have been saved to the /reports directory.")
+    print(f"Results have been recorded in {args.results_db} and {results_path}.")
+
+    # 5. Summarize the whole run in one leaderboard, plus detail for the best tasks
+    report_timer = StageTimer()
+    with report_timer.stage('report'):
+        leaderboard_path = os.path.join(run_dir, 'leaderboard.html')
+        generate_leaderboard_report(results_path, leaderboard_path)
+        print(f"Leaderboard saved to {leaderboard_path}")
+        write_top_reports(results_path, args.top_n_reports)
+    profile.add_timer(report_timer.totals)
+
+    if args.optimize or args.queue:
+        return
+    # Stage times are summed across workers, so they can exceed wall time
+    print(f"Data loaded {profile.batches} times for {tasks_to_run} tasks")
+    profile.print_summary(tasks_to_run)
+    if instrument is not None:
+        profile.write(os.path.join(run_dir, 'profile.json'), tasks_to_run)
+        print(f"Run profile saved to {os.path.join(run_dir, 'profile.json')}"
+              + (f", cProfile stats in {instrument['profile_dir']}" if args.profile else ""))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,95 @@
+import sys
+import json
+import glob
+import argparse
+import polars as pl
+from main import RUNS_DIR
+from src.config import INITIAL_CASH
+from src.data_preprocessor import BASE_TIMEFRAME
+from src.streaming import StreamRunner, replay_parquet, parse_bar_lines, socket_lines
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Paper-trade the best configurations of a sweep on a bar stream, updating indicators bar by bar.")
+    parser.add_argument('--results', default=None,
+                        help="Results table to pick configurations from (default: the latest results/runs/*/results.parquet).")
+    parser.add_argument('--top', type=int, default=5,
+                        help="Configurations per company, best PNL first.")
+    parser.add_argument('--timeframe', default=BASE_TIMEFRAME,
+                        help="Bar timeframe of the stream; only configurations tested on it are used.")
+    parser.add_argument('--source', choices=('replay', 'stdin', 'socket'), default='replay',
+                        help="'replay' streams the processed Parquet bars, 'stdin' and 'socket' read JSON bar lines.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9009)
+    parser.add_argument('--signals', default=None,
+                        help="Write signals as JSON lines to this file instead of printing them.")
+    return parser.parse_args()
+
+def load_configs(results_path, timeframe, top):
+    """The `top` completed configurations per company by PNL at one timeframe."""
+    best = (
+        pl.scan_parquet(results_path)
+        .filter((pl.col('status') == 'Completed') & (pl.col('timeframe') == timeframe))
+        .sort('pnl', descending=True, nulls_last=True)
+        .group_by('company', maintain_order=True)
+        .head(top)
+        .collect()
+    )
+    return [
+        (r['company'], r['ind1_name'], r['ind2_name'], json.loads(r['params1']), json.loads(r['params2']))
+        for r in best.iter_rows(named=True)
+    ]
+
+def main():
+    args = parse_args()
+    results_path = args.results or max(glob.glob(f"{RUNS_DIR}/*/results.parquet"), default=None)
+    if results_path is None:
+        print("No results table found. Run main.py first or pass --results.")
+        return
+    configs = load_configs(results_path, args.timeframe, args.top)
+    if not configs:
+        print(f"No completed {args.timeframe} configurations in {results_path}.")
+        return
+
+    runner = StreamRunner()
+    for config in configs:
+        runner.add(*config)
+    companies = list(runner.strategies)
+    print(f"--- Paper trading {len(configs)} configurations from {results_path} on {len(companies)} companies ---")
+
+    if args.source == 'replay':
+        stream = replay_parquet(companies, args.timeframe)
+    elif args.source == 'stdin':
+        stream = parse_bar_lines(sys.stdin)
+    else:
+        stream = parse_bar_lines(socket_lines(args.host, args.port))
+
+    out = open(args.signals, 'w') if args.signals else sys.stdout
+    signals = 0
+    try:
+        for symbol, bar in stream:
+            for strategy, action in runner.on_bar(symbol, bar):
+                signals += 1
+                out.write(json.dumps({
+                    'datetime': str(bar.datetime), 'symbol': symbol, 'action': action,
+                    'close': bar.close, 'strategy': strategy.label,
+                }) + '\n')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    latency = runner.latency_summary()
+    print(f"--- Stream ended: {latency['bars']} bars, {signals} signals ---")
+    if latency['bars']:
+        print(f"Per-bar latency: mean {latency['mean_us']:.1f}us, p50 {latency['p50_us']:.1f}us, "
+              f"p95 {latency['p95_us']:.1f}us, p99 {latency['p99_us']:.1f}us, max {latency['max_us']:.1f}us")
+    print("Paper PNL by configuration:")
+    strategies = [s for group in runner.strategies.values() for s, _, _ in group]
+    for strategy in sorted(strategies, key=lambda s: s.value(), reverse=True):
+        print(f"  {strategy.value() - INITIAL_CASH:10.2f}  "
+              f"{strategy.total_trades:4d} trades  {strategy.label}")
+
+if __name__ == '__main__':
+    main()
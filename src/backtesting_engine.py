@@ -1,29 +1,35 @@
-import os
 import backtrader as bt
+import pandas as pd
 import polars as pl
-from .report_generator import generate_html_report
-from .config import INDICATORS
+from .results_table import task_record, status_of, metric_groups
+from .config import INDICATORS, INITIAL_CASH, COMMISSION
+from .data_preprocessor import load_processed_data
+from .profiling import NULL_TIMER
+
+def prepare_data(data):
+    """
+    Converts a processed Polars frame, or a dict of shared NumPy columns, into
+    the indexed Pandas frame PandasData reads.
+    """
+    if isinstance(data, dict):
+        columns = {col: data[col] for col in ('open', 'high', 'low', 'close', 'volume')}
+        return pd.DataFrame(columns, index=pd.DatetimeIndex(data['datetime'], name='datetime'))
+    pd_df = data.to_pandas(use_pyarrow_extension_array=True)
+    pd_df.set_index('datetime', inplace=True)
+    return pd_df
 
 class PolarsDataFeed(bt.feeds.PandasData):
     """
-    A custom Backtrader data feed that accepts a Polars DataFrame.
+    A custom Backtrader data feed that accepts a Polars DataFrame, or a
+    Pandas frame already converted with prepare_data().
     This version is more robust to handle different initialization patterns.
     """
     def __init__(self, *args, **kwargs):
-        # The data can be passed as a positional arg or a keyword arg 'dataname'
-        dataname = kwargs.get('dataname', None)
-        if not dataname and args:
-            dataname = args[0]
-        
-        if isinstance(dataname, pl.DataFrame):
+        # Backtrader assigns 'dataname' to self.p before __init__ runs, so the
+        # Polars frame has to be swapped for its Pandas equivalent on self.p
+        if isinstance(self.p.dataname, pl.DataFrame):
             # Convert Polars to Pandas for Backtrader
-            pd_df = dataname.to_pandas(use_pyarrow_extension_array=True)
-            pd_df.set_index('datetime', inplace=True)
-            kwargs['dataname'] = pd_df # Set the keyword arg for the parent class
-            
-            # If 'dataname' was a positional arg, remove it from args
-            if args and args[0] is dataname:
-                args = args[1:]
+            self.p.dataname = prepare_data(self.p.dataname)
 
         super(PolarsDataFeed, self).__init__(*args, **kwargs)
 
@@ -31,6 +37,7 @@ class DualIndicatorStrategy(bt.Strategy):
     params = (
         ('indicator1_name', None), ('indicator2_name', None),
         ('indicator1_params', {}), ('indicator2_params', {}),
+        ('timer', NULL_TIMER),
     )
 
     def __init__(self):
@@ -39,12 +46,27 @@ class DualIndicatorStrategy(bt.Strategy):
         
         # CORRECTED: Initialize indicators using the explicit self.datas[0]
         # This is more robust than using the self.data alias.
-        self.ind1 = indicator1_class(self.datas[0], **self.p.indicator1_params)
-        self.ind2 = indicator2_class(self.datas[0], **self.p.indicator2_params)
+        with self.p.timer.stage('indicators'):
+            self.ind1 = indicator1_class(self.datas[0], **self.p.indicator1_params)
+            self.ind2 = indicator2_class(self.datas[0], **self.p.indicator2_params)
         self.order = None
 
-    def _get_signal(self, indicator_name, indicator):
+    def _next_analyzers(self, minperstatus, once=False):
+        # Analyzers update on every bar inside Cerebro's loop; timing them
+        # here splits the 'analyzers' stage out of 'backtest'
+        with self.p.timer.stage('analyzers'):
+            super(DualIndicatorStrategy, self)._next_analyzers(minperstatus, once)
+
+    def _stop(self):
+        # Analyzers such as SharpeRatio do their final computation on stop
+        with self.p.timer.stage('analyzers'):
+            super(DualIndicatorStrategy, self)._stop()
+
+    def _get_signal(self, indicator_name, indicator, data=None):
         # This logic determines buy/sell signals based on common indicator behavior
+        # on `data`, the feed the indicator was built on (default: the first one)
+        if data is None:
+            data = self.data
         try:
             if indicator_name == 'RSI':
                 if indicator.lines.rsi[0] < 30: return 1
@@ -62,14 +84,14 @@ class DualIndicatorStrategy(bt.Strategy):
                 if indicator.lines.percR[0] < -80: return 1
                 if indicator.lines.percR[0] > -20: return -1
             elif indicator_name == 'Supertrend':
-                if self.data.close[0] > indicator.lines.supertrend[0]: return 1
-                if self.data.close[0] < indicator.lines.supertrend[0]: return -1
+                if data.close[0] > indicator.lines.supertrend[0]: return 1
+                if data.close[0] < indicator.lines.supertrend[0]: return -1
             elif indicator_name == 'VWAP':
-                if self.data.close[0] > indicator.lines.vwap[0]: return 1
-                if self.data.close[0] < indicator.lines.vwap[0]: return -1
+                if data.close[0] > indicator.lines.vwap[0]: return 1
+                if data.close[0] < indicator.lines.vwap[0]: return -1
             else: # Fallback for simple single-line indicators
-                if self.data.close[0] > indicator.lines[0][0]: return 1
-                if self.data.close[0] < indicator.lines[0][0]: return -1
+                if data.close[0] > indicator.lines[0][0]: return 1
+                if data.close[0] < indicator.lines[0][0]: return -1
         except IndexError:
             # Not enough data to compute indicator yet
             return 0
@@ -88,39 +110,70 @@ class DualIndicatorStrategy(bt.Strategy):
         if order.status in [order.Completed, order.Canceled, order.Margin, order.Rejected]:
             self.order = None
 
-def run_single_backtest(args):
-    company, (ind1_name, ind2_name), params1, params2 = args
-    try:
-        data_path = f'data/processed/{company}.parquet'
-        if not os.path.exists(data_path): return f"SKIPPED: Data for {company} not found."
-        data = pl.read_parquet(data_path)
-        if data.is_empty(): return f"SKIPPED: Data for {company} is empty."
-    except Exception as e:
-        return f"ERROR loading data for {company}: {e}"
-    try:
-        cerebro = bt.Cerebro(stdstats=False)
-        cerebro.adddata(PolarsDataFeed(dataname=data))
-        cerebro.addstrategy(
-            DualIndicatorStrategy,
-            indicator1_name=ind1_name, indicator2_name=ind2_name,
-            indicator1_params=params1, indicator2_params=params2,
-        )
-        cerebro.broker.set_cash(100000.0)
-        cerebro.broker.setcommission(commission=0.002)
+def summarize_trades(trade_analysis):
+    """Extracts (total, won, lost) trade counts from a TradeAnalyzer result."""
+    # .get() avoids AutoOrderedDict raising KeyError once the analysis is closed
+    total_trades = trade_analysis.get('total', {}).get('total', 0)
+    wins = trade_analysis.get('won', {}).get('total', 0)
+    losses = trade_analysis.get('lost', {}).get('total', 0)
+    return total_trades, wins, losses
+
+def add_analyzers(cerebro, groups):
+    """Adds only the analyzers behind the requested optional metric groups."""
+    if 'trades' in groups:
         cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trade_analyzer')
+    if 'sharpe' in groups:
         cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe_ratio', timeframe=bt.TimeFrame.Days, compression=1, riskfreerate=0.0, annualize=True)
+    if 'drawdown' in groups:
         cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-        results = cerebro.run()
-        final_portfolio_value = cerebro.broker.getvalue()
-        trade_analysis = results[0].analyzers.trade_analyzer.get_analysis()
-        sharpe_ratio = results[0].analyzers.sharpe_ratio.get_analysis().get('sharperatio', None)
-        max_drawdown = results[0].analyzers.drawdown.get_analysis().max.drawdown
-        generate_html_report(
-            company=company, ind1_name=ind1_name, ind2_name=ind2_name,
-            params1=params1, params2=params2, final_value=final_portfolio_value,
-            pnl=final_portfolio_value - 100000.0, trades=trade_analysis,
-            sharpe=sharpe_ratio, max_dd=max_drawdown
-        )
-        return f"Completed: {company} {ind1_name}/{ind2_name} with PNL: {final_portfolio_value - 100000.0:.2f}"
+
+def analyzer_metrics(strategy, groups):
+    """Reads the metrics of the requested groups from a finished strategy's analyzers."""
+    metrics = {}
+    if 'trades' in groups:
+        metrics['total_trades'], metrics['wins'], metrics['losses'] = \
+            summarize_trades(strategy.analyzers.trade_analyzer.get_analysis())
+    if 'sharpe' in groups:
+        metrics['sharpe'] = strategy.analyzers.sharpe_ratio.get_analysis().get('sharperatio', None)
+    if 'drawdown' in groups:
+        metrics['max_drawdown'] = strategy.analyzers.drawdown.get_analysis().max.drawdown
+    return metrics
+
+def backtest_metrics(data, ind1_name, ind2_name, params1, params2, timer=NULL_TIMER, groups=None):
+    """
+    Runs one indicator pair through Cerebro and returns its metrics.
+    Only the analyzers of the optional metric groups (default: the worker's
+    metric_groups()) are added. Indicator construction and analyzer updates
+    are timed as the 'indicators' and 'analyzers' stages of timer.
+    """
+    groups = metric_groups() if groups is None else groups
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(PolarsDataFeed(dataname=data))
+    cerebro.addstrategy(
+        DualIndicatorStrategy,
+        indicator1_name=ind1_name, indicator2_name=ind2_name,
+        indicator1_params=params1, indicator2_params=params2, timer=timer,
+    )
+    cerebro.broker.set_cash(INITIAL_CASH)
+    cerebro.broker.setcommission(commission=COMMISSION)
+    add_analyzers(cerebro, groups)
+    results = cerebro.run()
+    with timer.stage('analyzers'):
+        metrics = analyzer_metrics(results[0], groups)
+    return dict(metrics, final_value=cerebro.broker.getvalue())
+
+def run_backtest_task(task, data, timer=NULL_TIMER):
+    """Runs one task on loaded (optionally prepared) company data and returns its metrics record."""
+    company, (ind1_name, ind2_name), params1, params2, timeframe = task
+    try:
+        metrics = backtest_metrics(data, ind1_name, ind2_name, params1, params2, timer)
+        pnl = metrics['final_value'] - INITIAL_CASH
+        message = f"Completed: {company} {timeframe} {ind1_name}/{ind2_name} with PNL: {pnl:.2f}"
+        return task_record(task, 'Completed', message, metrics, INITIAL_CASH)
     except Exception as e:
-        return f"ERROR during backtest for {company} with {ind1_name}/{ind2_name}: {e}"
+        return task_record(task, 'ERROR', f"ERROR during backtest for {company} {timeframe} with {ind1_name}/{ind2_name}: {e}")
+
+def run_single_backtest(args):
+    data, message = load_processed_data(args[0], timeframe=args[4])
+    if message: return task_record(args, status_of(message), message)
+    return run_backtest_task(args, data)
@@ -1,30 +1,52 @@
-import backtrader as bt
 from itertools import product
-from .custom_indicators import SuperTrend, OnBalanceVolume, VolumeWeightedAveragePrice
+from .lazy_registry import LazyRegistry
 
 # --- Dictionary mapping string names to Backtrader indicator classes ---
-INDICATORS = {
+# Classes are imported on first lookup, so reading the config (or the names
+# alone) does not load Backtrader
+INDICATORS = LazyRegistry({
     # Trend
-    'EMA': bt.indicators.ExponentialMovingAverage,
-    'MACD': bt.indicators.MACD,
-    'ADX': bt.indicators.AverageDirectionalMovementIndex,
-    'Supertrend': SuperTrend,
+    'EMA': 'backtrader.indicators:ExponentialMovingAverage',
+    'MACD': 'backtrader.indicators:MACD',
+    'ADX': 'backtrader.indicators:AverageDirectionalMovementIndex',
+    'Supertrend': '.custom_indicators:SuperTrend',
     # Momentum
-    'RSI': bt.indicators.RelativeStrengthIndex,
-    'Stochastic': bt.indicators.Stochastic,
-    'CCI': bt.indicators.CommodityChannelIndex,
-    'WilliamsR': bt.indicators.WilliamsR,
+    'RSI': 'backtrader.indicators:RelativeStrengthIndex',
+    'Stochastic': 'backtrader.indicators:Stochastic',
+    'CCI': 'backtrader.indicators:CommodityChannelIndex',
+    'WilliamsR': 'backtrader.indicators:WilliamsR',
     # Volatility
-    'BollingerBands': bt.indicators.BollingerBands,
-    'ATR': bt.indicators.AverageTrueRange,
+    'BollingerBands': 'backtrader.indicators:BollingerBands',
+    'ATR': 'backtrader.indicators:AverageTrueRange',
     # Volume
-    'OnBalanceVolume': OnBalanceVolume,
-    'VWAP': VolumeWeightedAveragePrice,
+    'OnBalanceVolume': '.custom_indicators:OnBalanceVolume',
+    'VWAP': '.custom_indicators:VolumeWeightedAveragePrice',
     # Other
-    'Ichimoku': bt.indicators.Ichimoku,
-    'FibonacciPivotPoint': bt.indicators.FibonacciPivotPoint,
-    'PivotPoint': bt.indicators.PivotPoint,
-}
+    'Ichimoku': 'backtrader.indicators:Ichimoku',
+    'FibonacciPivotPoint': 'backtrader.indicators:FibonacciPivotPoint',
+    'PivotPoint': 'backtrader.indicators:PivotPoint',
+}, package=__package__)
+
+# --- Broker settings shared by every backtesting engine ---
+INITIAL_CASH = 100000.0
+COMMISSION = 0.002
+
+# --- Memory budget for each worker's cache of computed indicator series ---
+INDICATOR_CACHE_MAX_MB = 256
+
+# --- Bar timeframes every indicator pair is tested on ---
+# Each must be one of the bar sets the preprocessor builds (BAR_TIMEFRAMES in
+# data_preprocessor.py). 'base' is a company's raw bars at their own
+# interval; daily data only has those.
+TIMEFRAMES = ['base', '5m', '15m', '1h']
+
+# --- Market session the preprocessor cuts intraday bars to ---
+# (open, close) local times, e.g. ('09:15', '15:30') for NSE. Intraday bars
+# outside it are dropped and resampled bars are aligned to its open. None
+# (the default) keeps every bar; set a session here or per company in
+# SESSIONS to opt in. Daily data is never filtered.
+DEFAULT_SESSION = None
+SESSIONS = {}
 
 # --- Parameter Grids for each indicator you want to test ---
 PARAM_GRID = {
@@ -1,4 +1,10 @@
+import numpy as np
 import backtrader as bt
+from .indicator_kernels import day_starts, supertrend_line, obv_line, vwap_line
+
+def _line_array(line):
+    """Zero-copy float64 view of a fully preloaded Backtrader line buffer."""
+    return np.frombuffer(line.array, dtype=np.float64)
 
 class SuperTrend(bt.Indicator):
     """SuperTrend indicator implementation."""
@@ -30,6 +36,14 @@ class SuperTrend(bt.Indicator):
             else:
                 self.lines.supertrend[0] = min(self.upper_band[0], self.lines.supertrend[-1])
 
+    def once(self, start, end):
+        # Batch path for runonce mode: same recursion, run over the preloaded arrays
+        values = supertrend_line(
+            _line_array(self.data.close)[:end], _line_array(self.upper_band)[:end],
+            _line_array(self.lower_band)[:end], self.p.period,
+        )
+        _line_array(self.lines.supertrend)[start:end] = values[start:end]
+
 class OnBalanceVolume(bt.Indicator):
     """On Balance Volume (OBV) custom implementation."""
     lines = ('obv',)
@@ -55,6 +69,10 @@ class OnBalanceVolume(bt.Indicator):
         else:
             self.lines.obv[0] = prev_obv
 
+    def once(self, start, end):
+        values = obv_line(_line_array(self.data.close)[:end], _line_array(self.data.volume)[:end])
+        _line_array(self.lines.obv)[start:end] = values[start:end]
+
 class VolumeWeightedAveragePrice(bt.Indicator):
     """Custom Volume Weighted Average Price (VWAP) with daily reset."""
     lines = ('vwap',)
@@ -83,4 +101,13 @@ class VolumeWeightedAveragePrice(bt.Indicator):
             self.lines.vwap[0] = self.tpv_cum / self.vol_cum
         else:
             # Fallback to close if no volume (e.g., first bar)
-            self.lines.vwap[0] = self.data.close[0]
\ No newline at end of file
+            self.lines.vwap[0] = self.data.close[0]
+
+    def once(self, start, end):
+        # Backtrader stores datetimes as float day numbers, so the integer part is the date
+        days = np.floor(_line_array(self.data.datetime)[:end])
+        values = vwap_line(
+            _line_array(self.data.high)[:end], _line_array(self.data.low)[:end],
+            _line_array(self.data.close)[:end], _line_array(self.data.volume)[:end], day_starts(days),
+        )
+        _line_array(self.lines.vwap)[start:end] = values[start:end]
@@ -1,57 +1,390 @@
 import polars as pl
 import os
+import json
+import shutil
+import hashlib
+import multiprocessing as mp
+from datetime import datetime
+from .config import DEFAULT_SESSION, SESSIONS
 
 RAW_DATA_DIR = 'data/raw/'
 PROCESSED_DATA_DIR = 'data/processed/'
+# Coarser bar sets resampled from the processed bars, one folder per timeframe
+RESAMPLED_DATA_DIR = 'data/resampled/'
+# Size, mtime and content hash of every raw CSV at the time it was processed
+MANIFEST_PATH = os.path.join(PROCESSED_DATA_DIR, 'manifest.json')
+
+REQUIRED_COLUMNS = ('datetime', 'open', 'high', 'low', 'close', 'volume')
+
+# Explicit dtypes, so Polars never has to infer the schema from the data
+COLUMN_DTYPES = {
+    'datetime': pl.String,
+    'open': pl.Float64,
+    'high': pl.Float64,
+    'low': pl.Float64,
+    'close': pl.Float64,
+    'volume': pl.Float64,
+}
+
+# Accepted timestamp layouts, tried in order. Add yours here instead of
+# relying on (slow) per-file format inference.
+DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+# CSVs larger than this are streamed into one Parquet file per month
+# (data/processed/<company>/YYYY-MM.parquet) so memory stays bounded
+STREAMING_THRESHOLD_MB = 256
+# Rows per Parquet row group; smaller groups make date filters more selective
+ROW_GROUP_SIZE = 100_000
+# Rows of a large file's staging copy split by month at a time, in whole row groups
+SPLIT_BATCH_ROWS = 10 * ROW_GROUP_SIZE
+
+# Bar sets built for every intraday company. The base set is the raw bars
+# themselves, at whatever interval the CSV has (1-minute, 5-minute, daily...);
+# the others are resampled from it, but only where they are coarser than it.
+BASE_TIMEFRAME = 'base'
+BAR_TIMEFRAMES = (BASE_TIMEFRAME, '5m', '15m', '1h')
+
+def file_fingerprint(path):
+    """Content hash of a file, read in 1 MB chunks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _bars_dir(timeframe):
+    if timeframe == BASE_TIMEFRAME:
+        return PROCESSED_DATA_DIR
+    return os.path.join(RESAMPLED_DATA_DIR, timeframe)
+
+def processed_path(company, timeframe=BASE_TIMEFRAME):
+    """
+    Path Polars should scan for a company's processed bars at a timeframe: a
+    single Parquet file, a glob over its monthly partitions, or None if there
+    is neither.
+    """
+    file_path = os.path.join(_bars_dir(timeframe), f"{company}.parquet")
+    if os.path.exists(file_path):
+        return file_path
+    partition_dir = os.path.join(_bars_dir(timeframe), company)
+    if os.path.isdir(partition_dir):
+        return os.path.join(partition_dir, '*.parquet')
+    return None
+
+def list_processed_companies():
+    """Companies with processed data, stored either as a file or as monthly partitions."""
+    if not os.path.exists(PROCESSED_DATA_DIR):
+        return []
+    companies = []
+    for name in sorted(os.listdir(PROCESSED_DATA_DIR)):
+        if name.endswith('.parquet'):
+            companies.append(name.split('.')[0])
+        elif os.path.isdir(os.path.join(PROCESSED_DATA_DIR, name)):
+            companies.append(name)
+    return companies
+
+def available_timeframes(company):
+    """Timeframes in BAR_TIMEFRAMES that have bars for a company."""
+    return [tf for tf in BAR_TIMEFRAMES if processed_path(company, tf) is not None]
+
+def processed_fingerprint(company, timeframe=BASE_TIMEFRAME):
+    """Content hash of a company's processed bars at a timeframe, covering every partition."""
+    file_path = os.path.join(_bars_dir(timeframe), f"{company}.parquet")
+    if os.path.exists(file_path):
+        return file_fingerprint(file_path)
+    partition_dir = os.path.join(_bars_dir(timeframe), company)
+    digest = hashlib.blake2b(digest_size=16)
+    for name in sorted(os.listdir(partition_dir)):
+        digest.update(name.encode())
+        digest.update(file_fingerprint(os.path.join(partition_dir, name)).encode())
+    return digest.hexdigest()
+
+def load_processed_data(company, start=None, end=None, timeframe=BASE_TIMEFRAME):
+    """
+    Reads a company's processed bars at a timeframe, optionally only bars in
+    [start, end). The date filter is pushed down to the Parquet scan, so
+    partitions and row groups outside the window are never read.
+    Returns (data, None) on success, or (None, message) if it can't be used.
+    """
+    data_path = processed_path(company, timeframe)
+    try:
+        if data_path is None:
+            if timeframe == BASE_TIMEFRAME: return None, f"SKIPPED: Data for {company} not found."
+            return None, f"SKIPPED: No {timeframe} bars for {company}."
+        lf = pl.scan_parquet(data_path)
+        if start is not None:
+            lf = lf.filter(pl.col('datetime') >= start)
+        if end is not None:
+            lf = lf.filter(pl.col('datetime') < end)
+        data = lf.collect()
+        if data.is_empty(): return None, f"SKIPPED: Data for {company} is empty."
+    except Exception as e:
+        return None, f"ERROR loading data for {company}: {e}"
+    return data, None
+
+def _load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+def _save_manifest(manifest):
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def _standard_name(col):
+    """Lower-cases a CSV header and maps common aliases to Backtrader names."""
+    col = col.lower()
+    return 'datetime' if col == 'date' else col
+
+def session_for(company):
+    """The (open, close) session used for a company, or None for all bars."""
+    return SESSIONS.get(company, DEFAULT_SESSION)
+
+def _processing_settings(company):
+    """Everything besides the CSV itself that changes a company's processed bars."""
+    session = session_for(company)
+    return {'session': list(session) if session else None, 'timeframes': list(BAR_TIMEFRAMES)}
+
+def _parse_time(text):
+    return datetime.strptime(text, '%H:%M').time()
+
+def _with_session_starts(lf):
+    """Flags the first bar of every trading day; the frame must be sorted by time."""
+    day = pl.col('datetime').dt.date()
+    return lf.with_columns((day != day.shift(1)).fill_null(True).alias('session_start'))
+
+def _timeframe_minutes(timeframe):
+    return int(timeframe[:-1]) * (60 if timeframe.endswith('h') else 1)
+
+def _resample(lf, timeframe, session):
+    """Aggregates sorted bars into `timeframe` bars, aligned to the session open."""
+    offset_minutes = 0
+    if session is not None:
+        open_time = _parse_time(session[0])
+        every_minutes = _timeframe_minutes(timeframe)
+        offset_minutes = (open_time.hour * 60 + open_time.minute) % every_minutes
+    return _with_session_starts(
+        lf.group_by_dynamic('datetime', every=timeframe, offset=f"{offset_minutes}m", closed='left', label='left')
+        .agg(
+            pl.col('open').first(),
+            pl.col('high').max(),
+            pl.col('low').min(),
+            pl.col('close').last(),
+            pl.col('volume').sum(),
+        )
+    )
+
+def _write_timeframes(company_symbol, interval_minutes, session):
+    """
+    Rebuilds every resampled bar set of a company from its processed bars,
+    keeping the same layout (one file, or one file per monthly partition).
+    Only timeframes coarser than the base bars' interval are built, so daily
+    data (interval None) gets no resampled sets.
+    """
+    for timeframe in BAR_TIMEFRAMES:
+        if timeframe == BASE_TIMEFRAME:
+            continue
+        out_dir = _bars_dir(timeframe)
+        out_file = os.path.join(out_dir, f"{company_symbol}.parquet")
+        out_partitions = os.path.join(out_dir, company_symbol)
+        if os.path.exists(out_file):
+            os.remove(out_file)
+        shutil.rmtree(out_partitions, ignore_errors=True)
+        if interval_minutes is None or _timeframe_minutes(timeframe) <= interval_minutes:
+            continue
+
+        base_file = os.path.join(PROCESSED_DATA_DIR, f"{company_symbol}.parquet")
+        if os.path.exists(base_file):
+            sources = [(base_file, out_file)]
+        else:
+            # Sessions never span months, so each partition is resampled on its own
+            base_partitions = os.path.join(PROCESSED_DATA_DIR, company_symbol)
+            os.makedirs(out_partitions)
+            sources = [
+                (os.path.join(base_partitions, name), os.path.join(out_partitions, name))
+                for name in sorted(os.listdir(base_partitions))
+            ]
+        os.makedirs(out_dir, exist_ok=True)
+        for source, target in sources:
+            lf = pl.scan_parquet(source).drop('session_start').sort('datetime')
+            _resample(lf, timeframe, session).sink_parquet(target, row_group_size=ROW_GROUP_SIZE)
+
+def _sink_monthly(lf, company_symbol):
+    """
+    Streams a cleaned scan into one sorted Parquet file per calendar month.
+
+    The CSV is streamed once into an unsorted staging file. That file is read
+    back once, SPLIT_BATCH_ROWS rows at a time, and each slice is split into
+    per-month chunk files; every month's chunks are then sorted and written
+    as its partition. Each bar is read and written a fixed number of times
+    however many months the file spans, and no step needs more than one slice
+    or one month of bars in memory.
+    """
+    staging_path = os.path.join(PROCESSED_DATA_DIR, f"{company_symbol}.staging.tmp")
+    chunk_dir = os.path.join(PROCESSED_DATA_DIR, f"{company_symbol}.chunks.tmp")
+    partition_dir = os.path.join(PROCESSED_DATA_DIR, company_symbol)
+    shutil.rmtree(chunk_dir, ignore_errors=True)
+    lf.sink_parquet(staging_path, row_group_size=ROW_GROUP_SIZE)
+    try:
+        rows = pl.scan_parquet(staging_path).select(pl.len()).collect().item()
+        for i, offset in enumerate(range(0, rows, SPLIT_BATCH_ROWS)):
+            batch = (
+                pl.scan_parquet(staging_path)
+                .slice(offset, SPLIT_BATCH_ROWS)
+                .with_columns(month=pl.col('datetime').dt.strftime('%Y-%m'))
+                .collect()
+            )
+            for (month,), part in batch.partition_by('month', as_dict=True, include_key=False).items():
+                os.makedirs(os.path.join(chunk_dir, month), exist_ok=True)
+                part.write_parquet(os.path.join(chunk_dir, month, f"{i:06d}.parquet"))
+
+        shutil.rmtree(partition_dir, ignore_errors=True)
+        os.makedirs(partition_dir)
+        for month in sorted(os.listdir(chunk_dir)):
+            chunks = pl.scan_parquet(os.path.join(chunk_dir, month, '*.parquet')).sort('datetime')
+            _with_session_starts(chunks).sink_parquet(
+                os.path.join(partition_dir, f"{month}.parquet"), row_group_size=ROW_GROUP_SIZE)
+    finally:
+        os.remove(staging_path)
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+def process_csv(filename):
+    """
+    Converts one raw CSV file to cleaned Parquet, using a streaming lazy scan.
+    Intraday bars are cut to the company's session if it has one, flagged
+    where each day starts, and resampled to every timeframe in BAR_TIMEFRAMES
+    that is coarser than their own interval.
+    Files above STREAMING_THRESHOLD_MB are partitioned by month.
+    Returns (filename, message, success) so it can run in a worker process.
+    """
+    company_symbol = filename.split('.')[0]
+    csv_path = os.path.join(RAW_DATA_DIR, filename)
+    parquet_path = os.path.join(PROCESSED_DATA_DIR, f"{company_symbol}.parquet")
+    partition_dir = os.path.join(PROCESSED_DATA_DIR, company_symbol)
+    try:
+        # Standardize column names from the header alone
+        header = pl.read_csv(csv_path, n_rows=0).columns
+        rename_map = {col: _standard_name(col) for col in header}
+
+        # Check for required columns
+        if not set(REQUIRED_COLUMNS).issubset(rename_map.values()):
+            return filename, f"Skipping {filename}: Missing one of the required columns (datetime, open, high, low, close, volume)", False
+
+        schema_overrides = {col: COLUMN_DTYPES[name] for col, name in rename_map.items() if name in COLUMN_DTYPES}
+        parsed = [pl.col('datetime').str.strptime(pl.Datetime, fmt, strict=False) for fmt in DATETIME_FORMATS]
+
+        raw = pl.scan_csv(csv_path, schema_overrides=schema_overrides).rename(rename_map)
+
+        # A timestamp matching none of DATETIME_FORMATS would parse to null and
+        # be dropped with the missing values, so the file is refused instead
+        unparsed, example = (
+            raw.filter(pl.col('datetime').is_not_null() & pl.coalesce(parsed).is_null())
+            .select(pl.len(), pl.col('datetime').first())
+            .collect()
+            .row(0)
+        )
+        if unparsed:
+            return filename, (f"Skipping {filename}: {unparsed} timestamps, e.g. '{example}', match none of "
+                              f"DATETIME_FORMATS {DATETIME_FORMATS}"), False
+
+        lf = (
+            raw.with_columns(pl.coalesce(parsed).alias('datetime'))
+            # Handle potential missing values
+            .drop_nulls()
+        )
+
+        # Bars all stamped at midnight are daily data, which has no session to cut
+        head = lf.head(1000).select('datetime').collect()
+        intraday = head.select((pl.col('datetime').dt.time() != pl.time(0)).any()).item()
+        # Typical spacing of the raw bars, which decides the timeframes worth resampling to
+        spacing = head['datetime'].sort().diff().median()
+        interval_minutes = max(1, int(spacing.total_seconds() // 60)) if intraday and spacing is not None else None
+        session = session_for(company_symbol)
+        if intraday and session is not None:
+            lf = lf.filter(pl.col('datetime').dt.time().is_between(
+                _parse_time(session[0]), _parse_time(session[1]), closed='left'))
+
+        # Save to a fast, efficient format, replacing any other layout
+        if os.path.getsize(csv_path) > STREAMING_THRESHOLD_MB * 1024 * 1024:
+            if os.path.exists(parquet_path):
+                os.remove(parquet_path)
+            _sink_monthly(lf, company_symbol)
+            _write_timeframes(company_symbol, interval_minutes, session)
+            return filename, f"Processed and saved monthly partitions for {company_symbol}", True
+
+        shutil.rmtree(partition_dir, ignore_errors=True)
+        # Ensure data is sorted by time
+        _with_session_starts(lf.sort('datetime')).sink_parquet(parquet_path, row_group_size=ROW_GROUP_SIZE)
+        _write_timeframes(company_symbol, interval_minutes, session)
+        return filename, f"Processed and saved data for {company_symbol}", True
+
+    except Exception as e:
+        return filename, f"Could not process {filename}. Error: {e}", False
 
 def process_all_data():
-    """Converts all raw CSV files to cleaned Parquet files."""
+    """
+    Converts raw CSV files to cleaned Parquet files, cut to each company's
+    session if one is set, plus a resampled bar set per coarser timeframe in
+    BAR_TIMEFRAMES.
+
+    Files whose size and mtime, or failing that content hash, match the
+    manifest from the previous run are skipped. The rest are processed in
+    parallel.
+    """
     if not os.path.exists(PROCESSED_DATA_DIR):
         os.makedirs(PROCESSED_DATA_DIR)
 
-    for filename in os.listdir(RAW_DATA_DIR):
-        if filename.endswith('.csv'):
-            company_symbol = filename.split('.')[0]
-            csv_path = os.path.join(RAW_DATA_DIR, filename)
-            
-            try:
-                # Read and process data with Polars
-                df = pl.read_csv(csv_path)
-
-                # Standardize column names
-                rename_map = {col: col.lower() for col in df.columns}
-                df = df.rename(rename_map)
-
-                # Ensure backtrader compatible names
-                df = df.rename({
-                    'date': 'datetime',  # Common alternative name
-                })
-
-                # Convert datetime string to actual datetime objects
-                # This tries to automatically parse common date formats
-                df = df.with_columns(
-                    pl.col('datetime').str.to_datetime().alias('datetime')
-                )
-
-                # Handle potential missing values
-                df = df.drop_nulls()
-
-                # Ensure data is sorted by time
-                df = df.sort('datetime')
-                
-                # Check for required columns
-                required_cols = {'datetime', 'open', 'high', 'low', 'close', 'volume'}
-                if not required_cols.issubset(df.columns):
-                    print(f"Skipping {filename}: Missing one of the required columns (datetime, open, high, low, close, volume)")
-                    continue
-
-                # Save to a fast, efficient format
-                parquet_path = os.path.join(PROCESSED_DATA_DIR, f"{company_symbol}.parquet")
-                df.write_parquet(parquet_path)
-                print(f"Processed and saved data for {company_symbol}")
-
-            except Exception as e:
-                print(f"Could not process {filename}. Error: {e}")
+    manifest = _load_manifest()
+    pending = {}
+    skipped = 0
+
+    for filename in sorted(os.listdir(RAW_DATA_DIR)):
+        if not filename.endswith('.csv'):
+            continue
+        csv_path = os.path.join(RAW_DATA_DIR, filename)
+        stat = os.stat(csv_path)
+        entry = manifest.get(filename)
+        settings = _processing_settings(filename.split('.')[0])
+        current = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'settings': settings}
+
+        # A changed session or timeframe list reprocesses the file even if it is unchanged
+        if entry and entry.get('settings') == settings and processed_path(filename.split('.')[0]) is not None:
+            if entry['size'] == current['size'] and entry['mtime_ns'] == current['mtime_ns']:
+                skipped += 1
+                continue
+            current['hash'] = file_fingerprint(csv_path)
+            if entry['hash'] == current['hash']:
+                # Touched but unchanged, only the recorded mtime needs updating
+                manifest[filename] = current
+                skipped += 1
+                continue
+        pending[filename] = current
+
+    if skipped:
+        print(f"Skipped {skipped} unchanged files")
+
+    if len(pending) > 1:
+        processes = min(len(pending), max(1, mp.cpu_count() - 1))
+        # Polars' thread pool does not survive fork(), so workers are spawned fresh
+        with mp.get_context('spawn').Pool(processes=processes) as pool:
+            outcomes = list(pool.imap_unordered(process_csv, pending))
+    else:
+        outcomes = [process_csv(filename) for filename in pending]
+
+    for filename, message, success in outcomes:
+        print(message)
+        if success:
+            entry = pending[filename]
+            if 'hash' not in entry:
+                entry['hash'] = file_fingerprint(os.path.join(RAW_DATA_DIR, filename))
+            manifest[filename] = entry
+        else:
+            manifest.pop(filename, None)
+
+    _save_manifest(manifest)
 
 if __name__ == '__main__':
     process_all_data()
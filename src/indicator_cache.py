@@ -0,0 +1,61 @@
+import hashlib
+from collections import OrderedDict
+
+def data_fingerprint(bars):
+    """Content hash of a company's OHLCV arrays, so stale entries never match."""
+    digest = hashlib.blake2b(digest_size=16)
+    for col in ('datetime', 'open', 'high', 'low', 'close', 'volume'):
+        digest.update(bars[col].tobytes())
+    return digest.hexdigest()
+
+def cache_key(company, indicator_name, params, fingerprint):
+    """Hashable key for one indicator/parameter series on one company's data."""
+    return (company, indicator_name, tuple(sorted(params.items())), fingerprint)
+
+class IndicatorCache:
+    """
+    Per-worker LRU cache of indicator signal arrays.
+
+    Every indicator pair that shares an (indicator, params) combination on the
+    same company reuses one computed series. Memory is capped at `max_bytes`;
+    the least recently used series are evicted first.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached (signal, minperiod) for key, computing it on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = compute()
+        size = entry[0].nbytes
+        if size > self.max_bytes:
+            # Larger than the whole budget, hand it back without caching
+            return entry
+
+        self._entries[key] = entry
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
@@ -0,0 +1,46 @@
+import numpy as np
+
+# --- Array kernels shared by the batch (once) paths of the custom Backtrader
+# indicators and the vectorized engine. Kept free of Backtrader, so the
+# vectorized engine never has to import it ---
+
+def day_starts(days):
+    """Indices of the first bar of every session, given each bar's day number."""
+    return np.concatenate(([0], np.flatnonzero(days[1:] != days[:-1]) + 1))
+
+def supertrend_line(close, upper_band, lower_band, period):
+    """SuperTrend values, NaN for the first `period` bars."""
+    close, upper, lower = close.tolist(), upper_band.tolist(), lower_band.tolist()
+    supertrend = [float('nan')] * len(close)
+    uptrend = True
+    # The trend flip depends on the previous output, so this stays a loop
+    for i in range(period, len(close)):
+        prev = supertrend[i - 1]
+        if uptrend:
+            if close[i - 1] < prev:
+                uptrend = False
+                supertrend[i] = upper[i]
+            else:
+                supertrend[i] = max(lower[i], prev)
+        else:
+            if close[i - 1] > prev:
+                uptrend = True
+                supertrend[i] = lower[i]
+            else:
+                supertrend[i] = min(upper[i], prev)
+    return np.array(supertrend)
+
+def obv_line(close, volume):
+    """On Balance Volume starting from 0 on the first bar."""
+    step = np.zeros(len(close))
+    step[1:] = np.where(close[1:] > close[:-1], volume[1:], np.where(close[1:] < close[:-1], -volume[1:], 0.0))
+    return np.cumsum(step)
+
+def vwap_line(high, low, close, volume, starts):
+    """Session VWAP whose running sums restart at every index in `starts`."""
+    tpv = (high + low + close) / 3 * volume
+    ends = np.append(starts[1:], len(close))
+    tpv_cum = np.concatenate([np.cumsum(tpv[a:b]) for a, b in zip(starts, ends)])
+    vol_cum = np.concatenate([np.cumsum(volume[a:b]) for a, b in zip(starts, ends)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(vol_cum > 0, tpv_cum / vol_cum, close)
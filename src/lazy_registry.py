@@ -0,0 +1,36 @@
+import importlib
+from collections.abc import Mapping
+
+class LazyRegistry(Mapping):
+    """
+    Read-only mapping of names to modules or classes, given as 'module' or
+    'module:attribute' paths and imported on first lookup. Listing or
+    checking the names imports nothing, so the CLI and every spawned worker
+    only pay for Backtrader or an engine once something actually uses it.
+    Relative module paths are resolved against `package`.
+    """
+    def __init__(self, paths, package=None):
+        self._paths = dict(paths)
+        self._package = package
+        self._resolved = {}
+
+    def __getitem__(self, name):
+        if name not in self._resolved:
+            module_name, _, attr = self._paths[name].partition(':')
+            value = importlib.import_module(module_name, self._package)
+            self._resolved[name] = getattr(value, attr) if attr else value
+        return self._resolved[name]
+
+    def __contains__(self, name):
+        return name in self._paths
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def resolve_all(self):
+        """Imports every entry now, e.g. while a worker process starts up."""
+        for name in self._paths:
+            self[name]
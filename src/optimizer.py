@@ -0,0 +1,55 @@
+import math
+from .data_preprocessor import load_processed_data
+from .results_table import task_record, task_score, status_of
+from .task_runner import ENGINES
+
+# Share of each bar set's history every successive-halving rung runs on; the
+# last rung must be 1.0 so survivors end with ordinary full-data results
+DEFAULT_RUNGS = (0.125, 0.25, 0.5, 1.0)
+# Share of each bar set's tasks promoted from one rung to the next
+DEFAULT_KEEP = 0.5
+
+def make_rung_batches(tasks, engine_name, batch_size, fraction):
+    """Groups one rung's tasks by company and timeframe, as the full sweep does."""
+    by_bars = {}
+    for task in tasks:
+        by_bars.setdefault((task[0], task[4]), []).append(task)
+    for (company, timeframe), bar_tasks in by_bars.items():
+        for i in range(0, len(bar_tasks), batch_size):
+            yield engine_name, company, timeframe, bar_tasks[i:i + batch_size], fraction
+
+def run_rung_batch(args):
+    """
+    Worker entry point for one rung: the same load-then-run_backtest_task
+    steps as run_single_backtest, but on only the most recent `fraction` of
+    the bars and with the data loaded once for the whole batch.
+    Returns a list of (task, record) pairs.
+    """
+    engine_name, company, timeframe, tasks, fraction = args
+    engine = ENGINES[engine_name]
+    data, message = load_processed_data(company, timeframe=timeframe)
+    if message:
+        return [(task, task_record(task, status_of(message), message)) for task in tasks]
+    if fraction < 1:
+        data = data.tail(max(1, math.ceil(len(data) * fraction)))
+    try:
+        prepared = engine.prepare_data(data)
+    except Exception as e:
+        message = f"ERROR preparing data for {company}: {e}"
+        return [(task, task_record(task, 'ERROR', message)) for task in tasks]
+    return [(task, engine.run_backtest_task(task, prepared)) for task in tasks]
+
+def survivors(results, keep, metric):
+    """
+    Tasks promoted to the next rung: the best `keep` share of each company
+    and timeframe by metric, at least one per bar set. Tasks that failed on a
+    short slice (e.g. too few bars for an indicator's warm-up) rank last.
+    """
+    by_bars = {}
+    for task, record in results:
+        by_bars.setdefault((task[0], task[4]), []).append((task, record))
+    promoted = []
+    for bar_results in by_bars.values():
+        bar_results.sort(key=lambda pair: task_score(pair[1], metric), reverse=True)
+        promoted.extend(task for task, _ in bar_results[:max(1, math.ceil(len(bar_results) * keep))])
+    return promoted
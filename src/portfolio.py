@@ -0,0 +1,211 @@
+import numpy as np
+import polars as pl
+import backtrader as bt
+from .config import INDICATORS, INITIAL_CASH, COMMISSION
+from .data_preprocessor import BASE_TIMEFRAME, load_processed_data
+from .results_table import task_record, metric_groups
+from .backtesting_engine import DualIndicatorStrategy, add_analyzers, analyzer_metrics
+
+# Name recorded in the company column of every portfolio result
+PORTFOLIO_NAME = 'PORTFOLIO'
+
+BLOCK_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+# Backtrader's float date of 1970-01-01 (days since 0001-01-01, plus one)
+_UNIX_EPOCH_NUM = 719163.0
+
+# Entries are sized at the signal bar's close but fill at the next bar's
+# open; this share of each budget is kept back so a gap up still fits the cash
+SIZE_HEADROOM = 0.02
+_US_PER_DAY = 86400 * 10**6
+
+def load_block(companies, timeframe=BASE_TIMEFRAME):
+    """
+    Loads several companies' bars into one aligned columnar block: a shared,
+    sorted 'datetime' index (and its Backtrader dates, 'datenum'), one
+    (bars x companies) float array per OHLCV column, NaN wherever a company
+    has no bar at that timestamp, and each company's present 'rows'.
+    Companies without bars at this timeframe are left out.
+    Returns (block, skipped messages).
+    """
+    frames, loaded, skipped = [], [], []
+    for company in companies:
+        data, message = load_processed_data(company, timeframe=timeframe)
+        if message:
+            skipped.append(message)
+            continue
+        frames.append(data.select('datetime', *BLOCK_COLUMNS).with_columns(symbol=pl.lit(len(loaded), pl.Int64)))
+        loaded.append(company)
+    if not frames:
+        return None, skipped
+
+    bars = pl.concat(frames)
+    index = bars['datetime'].unique().sort()
+    rows = index.search_sorted(bars['datetime']).to_numpy()
+    symbols = bars['symbol'].to_numpy()
+    micros = index.to_numpy().astype('datetime64[us]').astype(np.int64)
+    block = {
+        'companies': loaded,
+        'datetime': index.to_numpy(),
+        # The index as Backtrader float dates, converted once for every feed
+        'datenum': _UNIX_EPOCH_NUM + micros / _US_PER_DAY,
+    }
+    for col in BLOCK_COLUMNS:
+        values = np.full((len(index), len(loaded)), np.nan)
+        values[rows, symbols] = bars[col].to_numpy().astype(np.float64)
+        block[col] = values
+    # Rows of the index each company has a bar at
+    block['rows'] = [np.flatnonzero(~np.isnan(block['close'][:, i])) for i in range(len(loaded))]
+    return block, skipped
+
+class BlockDataFeed(bt.feed.DataBase):
+    """
+    Feeds one company's column of an aligned block to Backtrader, skipping
+    the timestamps where it has no bar. Cerebro keeps the feeds of a
+    portfolio in step on their datetimes, so no per-company Pandas frame is built.
+    Bars are read straight from the block's arrays, which every task of a
+    batch shares.
+    """
+    params = (('block', None), ('column', 0),)
+
+    def start(self):
+        super(BlockDataFeed, self).start()
+        block, col = self.p.block, self.p.column
+        self._rows = block['rows'][col]
+        self._datenum = block['datenum']
+        self._columns = [block[c][:, col] for c in BLOCK_COLUMNS]
+        self._next_row = 0
+
+    def _load(self):
+        if self._next_row >= len(self._rows):
+            return False
+        row = self._rows[self._next_row]
+        self._next_row += 1
+        o, h, l, c, v = self._columns
+        self.lines.datetime[0] = self._datenum[row]
+        self.lines.open[0] = o[row]
+        self.lines.high[0] = h[row]
+        self.lines.low[0] = l[row]
+        self.lines.close[0] = c[row]
+        self.lines.volume[0] = v[row]
+        self.lines.openinterest[0] = 0.0
+        return True
+
+class PortfolioStrategy(DualIndicatorStrategy):
+    """
+    DualIndicatorStrategy on every feed at once, trading from one broker
+    account. Each entry is sized to `allocation` of the current portfolio
+    value (default: an equal 1/N slot per company), capped by the cash not
+    already committed to open buy orders, and bought in whole units, less
+    SIZE_HEADROOM for the fill price. Buys the broker still rejects for
+    margin are counted in margin_rejections.
+    """
+    params = (('allocation', None),)
+
+    def __init__(self):
+        indicator1_class = INDICATORS[self.p.indicator1_name]
+        indicator2_class = INDICATORS[self.p.indicator2_name]
+        with self.p.timer.stage('indicators'):
+            self.ind1 = [indicator1_class(d, **self.p.indicator1_params) for d in self.datas]
+            self.ind2 = [indicator2_class(d, **self.p.indicator2_params) for d in self.datas]
+        self.allocation = self.p.allocation or 1.0 / len(self.datas)
+        # Per-feed open order and the cash set aside for it. Line objects
+        # overload ==, so feeds are tracked by position rather than as dict keys
+        self.orders = [None] * len(self.datas)
+        self.committed = [0.0] * len(self.datas)
+        self.slots = {}
+        # Buy orders the broker refused for lack of cash, e.g. after a gap up
+        self.margin_rejections = 0
+        # Bars each feed had at the previous step; a feed only trades on a new bar of its own
+        self.seen = [0] * len(self.datas)
+        self.ready = [max(i1._minperiod, i2._minperiod) for i1, i2 in zip(self.ind1, self.ind2)]
+
+    def prenext(self):
+        # Feeds warm up at different times; each is checked against its own indicators
+        self.next()
+
+    def next(self):
+        value = self.broker.getvalue()
+        for i, d in enumerate(self.datas):
+            if len(d) == self.seen[i]:
+                continue
+            self.seen[i] = len(d)
+            if len(d) < self.ready[i] or self.orders[i]:
+                continue
+            signal1 = self._get_signal(self.p.indicator1_name, self.ind1[i], d)
+            signal2 = self._get_signal(self.p.indicator2_name, self.ind2[i], d)
+            if not self.getposition(d).size:
+                if signal1 == 1 and signal2 == 1:
+                    cost = d.close[0] * (1 + COMMISSION) * (1 + SIZE_HEADROOM)
+                    budget = min(value * self.allocation, self.broker.getcash() - sum(self.committed))
+                    size = int(budget / cost)
+                    if size > 0:
+                        self.committed[i] = size * cost
+                        self.orders[i] = self.buy(data=d, size=size)
+                        self.slots[self.orders[i].ref] = i
+            elif signal1 == -1 or signal2 == -1:
+                self.orders[i] = self.close(data=d)
+                self.slots[self.orders[i].ref] = i
+
+    def notify_order(self, order):
+        if order.status in [order.Completed, order.Canceled, order.Margin, order.Rejected]:
+            if order.status == order.Margin:
+                self.margin_rejections += 1
+            i = self.slots.pop(order.ref)
+            self.orders[i] = None
+            self.committed[i] = 0.0
+
+def portfolio_metrics(block, ind1_name, ind2_name, params1, params2, allocation=None):
+    """Runs one indicator pair over every company of an aligned block with shared capital."""
+    cerebro = bt.Cerebro(stdstats=False)
+    for col, company in enumerate(block['companies']):
+        cerebro.adddata(BlockDataFeed(block=block, column=col), name=company)
+    cerebro.addstrategy(
+        PortfolioStrategy,
+        indicator1_name=ind1_name, indicator2_name=ind2_name,
+        indicator1_params=params1, indicator2_params=params2, allocation=allocation,
+    )
+    cerebro.broker.set_cash(INITIAL_CASH)
+    cerebro.broker.setcommission(commission=COMMISSION)
+    groups = metric_groups()
+    add_analyzers(cerebro, groups)
+    results = cerebro.run()
+    return dict(analyzer_metrics(results[0], groups), final_value=cerebro.broker.getvalue(),
+                margin_rejections=results[0].margin_rejections)
+
+def make_portfolio_batches(companies, timeframes, pair_grids, batch_size, allocation=None):
+    """
+    Batches of (PORTFOLIO_NAME, pair, params1, params2, timeframe) tasks, each
+    carrying the companies to load; a worker builds the block once per batch.
+    """
+    for timeframe in timeframes:
+        tasks = [(PORTFOLIO_NAME, pair, p1, p2, timeframe) for pair, grid in pair_grids for p1, p2 in grid]
+        for i in range(0, len(tasks), batch_size):
+            yield companies, timeframe, tasks[i:i + batch_size], allocation
+
+def run_portfolio_batch(args):
+    """
+    Worker entry point: loads the aligned block for one timeframe, then runs
+    every task of the batch on it. Returns a list of (task, record) pairs.
+    """
+    companies, timeframe, tasks, allocation = args
+    block, _ = load_block(companies, timeframe)
+    if block is None:
+        message = f"SKIPPED: No {timeframe} bars for any portfolio company."
+        return [(task, task_record(task, 'SKIPPED', message)) for task in tasks]
+
+    results = []
+    for task in tasks:
+        _, (ind1_name, ind2_name), params1, params2, _ = task
+        label = f"{PORTFOLIO_NAME} of {len(block['companies'])} {timeframe} {ind1_name}/{ind2_name}"
+        try:
+            metrics = portfolio_metrics(block, ind1_name, ind2_name, params1, params2, allocation)
+            pnl = metrics['final_value'] - INITIAL_CASH
+            message = f"Completed: {label} with PNL: {pnl:.2f}"
+            if metrics['margin_rejections']:
+                message += f" ({metrics['margin_rejections']} buys rejected for margin)"
+            record = task_record(task, 'Completed', message, metrics, INITIAL_CASH)
+        except Exception as e:
+            record = task_record(task, 'ERROR', f"ERROR during backtest for {label}: {e}")
+        results.append((task, record))
+    return results
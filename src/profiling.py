@@ -0,0 +1,148 @@
+import os
+import sys
+import time
+import json
+import cProfile
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+class StageTimer:
+    """
+    Accumulates wall and CPU seconds per named stage.
+
+    Stages may nest; time spent in an inner stage is only counted there, so
+    the totals of all stages add up to the time actually measured.
+    """
+    def __init__(self):
+        self.totals = {}
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        self._stack.append([0.0, 0.0])
+        try:
+            yield
+        finally:
+            inner_wall, inner_cpu = self._stack.pop()
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            total = self.totals.setdefault(name, [0.0, 0.0])
+            total[0] += wall - inner_wall
+            total[1] += cpu - inner_cpu
+            if self._stack:
+                self._stack[-1][0] += wall
+                self._stack[-1][1] += cpu
+
+    def snapshot(self):
+        """Copy of the current totals, to measure one unit of work with since()."""
+        return {name: tuple(total) for name, total in self.totals.items()}
+
+    def since(self, snapshot):
+        """Wall and CPU seconds per stage accumulated after `snapshot` was taken."""
+        deltas = {}
+        for name, (wall, cpu) in self.totals.items():
+            wall_before, cpu_before = snapshot.get(name, (0.0, 0.0))
+            if wall != wall_before or cpu != cpu_before:
+                deltas[name] = [wall - wall_before, cpu - cpu_before]
+        return deltas
+
+class _NullTimer:
+    """Stand-in used when a run is not instrumented; times nothing."""
+    def stage(self, name):
+        return nullcontext()
+
+NULL_TIMER = _NullTimer()
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+def profile_call(path, func, *args):
+    """Runs func(*args) under cProfile, dumps the stats to path and returns its result."""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        profiler.dump_stats(path)
+
+class RunProfile:
+    """
+    Driver-side aggregate of the stats every worker batch returns.
+
+    Stage totals are summed across workers, so they can exceed wall time;
+    tasks/sec is measured against the driver's own wall clock.
+    """
+    def __init__(self, stages):
+        self.stages = {stage: [0.0, 0.0] for stage in stages}
+        self.tasks = []
+        self.worker_rss = {}
+        self.batches = 0
+        self._started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, stats):
+        """Merges the stats returned by one worker batch."""
+        self.batches += 1
+        self.add_timer(stats['stages'])
+        self.tasks.extend(stats.get('tasks', ()))
+        if stats.get('rss_mb') is not None:
+            pid = stats['pid']
+            self.worker_rss[pid] = max(self.worker_rss.get(pid, 0.0), stats['rss_mb'])
+
+    def add_timer(self, totals):
+        """Merges stage totals, e.g. the driver's own report-writing timer."""
+        for stage, (wall, cpu) in totals.items():
+            total = self.stages.setdefault(stage, [0.0, 0.0])
+            total[0] += wall
+            total[1] += cpu
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._started
+
+    def slowest(self, n=10):
+        return sorted(self.tasks, key=lambda t: t['wall'], reverse=True)[:n]
+
+    def summary(self, tasks_run):
+        return {
+            'tasks_run': tasks_run,
+            'batches': self.batches,
+            'elapsed_s': self.elapsed,
+            'tasks_per_s': tasks_run / self.elapsed if self.elapsed > 0 else None,
+            'stages': {stage: {'wall_s': wall, 'cpu_s': cpu} for stage, (wall, cpu) in self.stages.items()},
+            'worker_peak_rss_mb': self.worker_rss,
+            'slowest_tasks': self.slowest(),
+        }
+
+    def print_summary(self, tasks_run):
+        summary = self.summary(tasks_run)
+        print(f"Ran {tasks_run} tasks in {self.batches} batches over {self.elapsed:.2f}s"
+              + (f" ({summary['tasks_per_s']:.1f} tasks/sec)" if summary['tasks_per_s'] else ""))
+        print(f"  {'stage':<10} {'wall':>9} {'cpu':>9}")
+        for stage, (wall, cpu) in self.stages.items():
+            print(f"  {stage:<10} {wall:8.2f}s {cpu:8.2f}s")
+        if self.worker_rss:
+            print(f"  peak worker RSS: {max(self.worker_rss.values()):.1f} MB across {len(self.worker_rss)} workers")
+        if self.tasks:
+            print("  slowest tasks:")
+            for t in self.slowest():
+                flag = ' (profiled)' if t['profiled'] else ''
+                print(f"    {t['wall']:7.3f}s  {t['label']}{flag}")
+                task_stages = t.get('stages', {})
+                stages = ', '.join(f"{stage} {task_stages[stage][0]:.3f}s" for stage in self.stages if stage in task_stages)
+                if stages:
+                    print(f"              {stages}")
+
+    def write(self, path, tasks_run):
+        """Writes the summary plus every task's timings and stage breakdown as JSON."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(dict(self.summary(tasks_run), tasks=self.tasks), f, indent=2)
@@ -1,7 +1,8 @@
 import os
 import math
+import polars as pl
 
-def generate_html_report(company, ind1_name, ind2_name, params1, params2, final_value, pnl, trades, sharpe, max_dd):
+def generate_html_report(company, ind1_name, ind2_name, params1, params2, final_value, pnl, total_trades, wins, losses, sharpe, max_dd, timeframe='base'):
     """Generates and saves a single HTML report for a backtest run."""
     
     # Create a clean string for filenames
@@ -12,17 +13,17 @@ def generate_html_report(company, ind1_name, ind2_name, params1, params2, final_
     report_dir = f'reports/{company}/'
     os.makedirs(report_dir, exist_ok=True)
     
-    filename = f"{report_dir}report_{ind1_name}_{p1_str}_{ind2_name}_{p2_str}.html"
+    filename = f"{report_dir}report_{timeframe}_{ind1_name}_{p1_str}_{ind2_name}_{p2_str}.html"
 
-    # --- Extract and clean metrics from TradeAnalyzer ---
-    total_trades = trades.total.total if trades and trades.total else 0
-    wins = trades.won.total if trades and trades.won else 0
-    losses = trades.lost.total if trades and trades.lost else 0
-    win_rate = (wins / total_trades * 100) if total_trades > 0 else 0
+    # --- Derive and clean metrics for display ---
+    win_rate = (wins / total_trades * 100) if total_trades else 0
     
     # Clean up potential None or NaN values for display
     sharpe_display = f"{sharpe:.3f}" if sharpe and not math.isnan(sharpe) else 'N/A'
     pnl_display = f"{pnl:,.2f}" if pnl and not math.isnan(pnl) else 'N/A'
+    # Metrics the run did not compute (see --metrics) are None
+    max_dd_display = f"{max_dd:.2f}" if max_dd is not None else 'N/A'
+    win_rate_display = f"{win_rate:.2f}" if total_trades is not None else 'N/A'
     
     html = f"""
     <!DOCTYPE html>
@@ -46,6 +47,7 @@ def generate_html_report(company, ind1_name, ind2_name, params1, params2, final_
             <h2>Configuration</h2>
             <table>
                 <tr><th>Company</th><td>{company}</td></tr>
+                <tr><th>Timeframe</th><td>{timeframe}</td></tr>
                 <tr><th>Indicator 1</th><td>{ind1_name} (Params: {params1 or 'Default'})</td></tr>
                 <tr><th>Indicator 2</th><td>{ind2_name} (Params: {params2 or 'Default'})</td></tr>
             </table>
@@ -55,11 +57,11 @@ def generate_html_report(company, ind1_name, ind2_name, params1, params2, final_
                 <tr><th>Net Profit/Loss (PNL)</th><td>{pnl_display}</td></tr>
                 <tr><th>Final Portfolio Value</th><td>{final_value:,.2f}</td></tr>
                 <tr><th>Sharpe Ratio (Annualized)</th><td>{sharpe_display}</td></tr>
-                <tr><th>Max Drawdown (%)</th><td>{max_dd:.2f}</td></tr>
+                <tr><th>Max Drawdown (%)</th><td>{max_dd_display}</td></tr>
                 <tr><th>Total Trades</th><td>{total_trades}</td></tr>
                 <tr><th>Winning Trades</th><td>{wins}</td></tr>
                 <tr><th>Losing Trades</th><td>{losses}</td></tr>
-                <tr><th>Win Rate (%)</th><td>{win_rate:.2f}</td></tr>
+                <tr><th>Win Rate (%)</th><td>{win_rate_display}</td></tr>
             </table>
         </div>
     </body>
@@ -67,4 +69,86 @@ def generate_html_report(company, ind1_name, ind2_name, params1, params2, final_
     """
 
     with open(filename, 'w') as f:
-        f.write(html)
\ No newline at end of file
+        f.write(html)
+
+def generate_leaderboard_report(results_path, output_path, max_rows=5000):
+    """
+    Renders one sortable HTML leaderboard for a whole run from its Parquet
+    results table. Completed tasks are ranked by PNL; clicking a column header
+    re-sorts the table in the browser.
+    """
+    # Scanned lazily, so only the shown rows of a large sweep are ever loaded
+    results = pl.scan_parquet(results_path)
+    is_completed = pl.col('status') == 'Completed'
+    total, completed = results.select(pl.len(), is_completed.sum()).collect().row(0)
+    failed = total - completed
+    shown = results.filter(is_completed).sort('pnl', descending=True, nulls_last=True).head(max_rows).collect()
+
+    def fmt(value, spec):
+        return format(value, spec) if value is not None and not math.isnan(value) else '–'
+
+    rows = []
+    for rank, r in enumerate(shown.iter_rows(named=True), 1):
+        rows.append(
+            f"<tr><td>{rank}</td><td>{r['company']}</td><td>{r['timeframe']}</td>"
+            f"<td>{r['ind1_name']} {r['params1']}</td><td>{r['ind2_name']} {r['params2']}</td>"
+            f"<td>{fmt(r['pnl'], ',.2f')}</td><td>{fmt(r['sharpe'], '.3f')}</td>"
+            f"<td>{fmt(r['max_drawdown'], '.2f')}</td><td>{fmt(r['total_trades'], 'd')}</td>"
+            f"<td>{fmt(r['win_rate'], '.2f')}</td></tr>"
+        )
+
+    html = f"""
+    <!DOCTYPE html>
+    <html lang="en">
+    <head>
+        <meta charset="UTF-8">
+        <title>Backtest Leaderboard</title>
+        <style>
+            body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif; margin: 2em; background-color: #f8f9fa; color: #212529; }}
+            .container {{ max-width: 1200px; margin: auto; background: white; padding: 2em; border-radius: 8px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); }}
+            h1 {{ color: #0056b3; border-bottom: 2px solid #dee2e6; padding-bottom: 0.3em; }}
+            table {{ border-collapse: collapse; width: 100%; margin-top: 1.5em; }}
+            th, td {{ border: 1px solid #dee2e6; padding: 8px; text-align: left; }}
+            th {{ background-color: #e9ecef; font-weight: 600; cursor: pointer; }}
+            tr:nth-child(even) {{ background-color: #f8f9fa; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>Backtest Leaderboard</h1>
+            <p>{completed} completed tasks ({failed} skipped or failed). Showing the top {shown.height} by PNL; click a header to sort.</p>
+            <table id="leaderboard">
+                <thead><tr>
+                    <th>Rank</th><th>Company</th><th>Timeframe</th><th>Indicator 1</th><th>Indicator 2</th>
+                    <th>PNL</th><th>Sharpe</th><th>Max DD (%)</th><th>Trades</th><th>Win Rate (%)</th>
+                </tr></thead>
+                <tbody>
+                {''.join(rows)}
+                </tbody>
+            </table>
+        </div>
+        <script>
+            document.querySelectorAll('#leaderboard th').forEach((th, col) => {{
+                let ascending = false;
+                th.addEventListener('click', () => {{
+                    const body = document.querySelector('#leaderboard tbody');
+                    const key = row => {{
+                        const text = row.children[col].textContent.replace(/,/g, '');
+                        const num = parseFloat(text);
+                        return isNaN(num) ? text : num;
+                    }};
+                    ascending = !ascending;
+                    const sorted = [...body.rows].sort((a, b) => {{
+                        const x = key(a), y = key(b);
+                        return (x > y ? 1 : x < y ? -1 : 0) * (ascending ? 1 : -1);
+                    }});
+                    sorted.forEach(row => body.appendChild(row));
+                }});
+            }});
+        </script>
+    </body>
+    </html>
+    """
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(html)
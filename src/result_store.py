@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+import sqlite3
+import polars as pl
+from .config import INITIAL_CASH, COMMISSION
+from .results_table import RESULT_SCHEMA, METRIC_COLUMNS, METRIC_GROUPS
+
+RESULTS_DB = 'results/results.sqlite'
+
+def engine_settings(engine_name, metric_groups=None):
+    """Everything besides the task itself that can change a task's result."""
+    settings = {'engine': engine_name, 'initial_cash': INITIAL_CASH, 'commission': COMMISSION}
+    # Only runs that skip metrics get a new key, so stores of full runs stay valid
+    if metric_groups is not None and set(metric_groups) != set(METRIC_GROUPS):
+        settings['metrics'] = sorted(metric_groups)
+    return settings
+
+def task_hash(task, data_fingerprint, settings):
+    """Stable key for one task on one version of a company's data."""
+    company, (ind1_name, ind2_name), params1, params2, timeframe = task
+    payload = json.dumps(
+        [data_fingerprint, settings, company, timeframe, ind1_name, ind2_name, params1, params2],
+        sort_keys=True,
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+class ResultStore:
+    """
+    SQLite table of finished backtest tasks, keyed by task hash.
+
+    Each row holds the task's full metrics record. A task is finished once
+    it completed successfully; skipped and failed tasks are recorded too but
+    run again on the next invocation.
+    """
+    def __init__(self, path=RESULTS_DB):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                task_hash TEXT PRIMARY KEY,
+                company TEXT, timeframe TEXT, ind1_name TEXT, ind2_name TEXT,
+                params1 TEXT, params2 TEXT, engine TEXT,
+                status TEXT, result TEXT,
+                finished_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Stores created before metrics or timeframes were kept only lack these columns
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(results)")}
+        if 'timeframe' not in existing:
+            self.conn.execute("ALTER TABLE results ADD COLUMN timeframe TEXT")
+        for col in METRIC_COLUMNS:
+            if col not in existing:
+                sql_type = 'INTEGER' if RESULT_SCHEMA[col] == pl.Int64 else 'REAL'
+                self.conn.execute(f"ALTER TABLE results ADD COLUMN {col} {sql_type}")
+        self.conn.commit()
+
+    def finished(self):
+        """Hashes of every task that already completed with its metrics stored."""
+        rows = self.conn.execute("SELECT task_hash FROM results WHERE status = 'Completed' AND final_value IS NOT NULL")
+        return {row[0] for row in rows}
+
+    def record(self, rows, engine_name):
+        """Saves (task_hash, record) rows in one transaction."""
+        columns = ('task_hash', 'company', 'timeframe', 'ind1_name', 'ind2_name', 'params1', 'params2',
+                   'engine', 'status', 'result') + METRIC_COLUMNS
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO results ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            [
+                (key, record['company'], record['timeframe'], record['ind1_name'], record['ind2_name'],
+                 record['params1'], record['params2'], engine_name,
+                 record['status'], record['message'])
+                + tuple(record[col] for col in METRIC_COLUMNS)
+                for key, record in rows
+            ],
+        )
+        self.conn.commit()
+
+    def records(self, keys, chunk_size=500):
+        """Yields the stored metrics records for the given task hashes."""
+        keys = list(keys)
+        columns = ('company', 'timeframe', 'ind1_name', 'ind2_name', 'params1', 'params2', 'status', 'result') + METRIC_COLUMNS
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            rows = self.conn.execute(
+                f"SELECT {', '.join(columns)} FROM results "
+                f"WHERE task_hash IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            for row in rows:
+                record = dict(zip(columns, row))
+                record['message'] = record.pop('result')
+                yield record
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
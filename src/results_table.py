@@ -0,0 +1,140 @@
+import os
+import json
+import polars as pl
+
+# Records are buffered and written as one Parquet row group per batch
+RESULTS_BATCH_SIZE = 5000
+
+# Column layout of a metrics record, shared by every engine and the result store
+RESULT_SCHEMA = {
+    'company': pl.String,
+    'timeframe': pl.String,
+    'ind1_name': pl.String,
+    'ind2_name': pl.String,
+    'params1': pl.String,
+    'params2': pl.String,
+    'status': pl.String,
+    'message': pl.String,
+    'final_value': pl.Float64,
+    'pnl': pl.Float64,
+    'total_trades': pl.Int64,
+    'wins': pl.Int64,
+    'losses': pl.Int64,
+    'win_rate': pl.Float64,
+    'sharpe': pl.Float64,
+    'max_drawdown': pl.Float64,
+}
+
+METRIC_COLUMNS = ('final_value', 'pnl', 'total_trades', 'wins', 'losses', 'win_rate', 'sharpe', 'max_drawdown')
+
+# Metrics that can rank tasks against each other, e.g. to pick parameters
+SELECTION_METRICS = ('pnl', 'sharpe')
+
+# Optional metrics, by the columns each group fills. Final value and PNL are
+# always computed; a run can skip the rest, e.g. Backtrader's analyzers
+METRIC_GROUPS = {
+    'trades': ('total_trades', 'wins', 'losses', 'win_rate'),
+    'sharpe': ('sharpe',),
+    'drawdown': ('max_drawdown',),
+}
+
+# Groups every engine computes in this process; task_runner.init_worker sets them for a run
+_metric_groups = frozenset(METRIC_GROUPS)
+
+def set_metric_groups(groups):
+    """Chooses the optional metric groups computed for every task in this process."""
+    global _metric_groups
+    _metric_groups = frozenset(groups)
+
+def metric_groups():
+    return _metric_groups
+
+def task_record(task, status, message, metrics=None, initial_cash=None):
+    """
+    Builds the metrics record a worker returns for one task.
+    status is 'Completed', 'SKIPPED' or 'ERROR'; message is the progress line.
+    """
+    company, (ind1_name, ind2_name), params1, params2, timeframe = task
+    record = {
+        'company': company,
+        'timeframe': timeframe,
+        'ind1_name': ind1_name,
+        'ind2_name': ind2_name,
+        'params1': json.dumps(params1, sort_keys=True),
+        'params2': json.dumps(params2, sort_keys=True),
+        'status': status,
+        'message': message,
+    }
+    record.update(dict.fromkeys(METRIC_COLUMNS))
+    if metrics is not None:
+        # Metrics of groups the run skipped are missing and stay None
+        total_trades = metrics.get('total_trades')
+        record.update(
+            final_value=metrics['final_value'],
+            pnl=metrics['final_value'] - initial_cash,
+            total_trades=total_trades,
+            wins=metrics.get('wins'),
+            losses=metrics.get('losses'),
+            sharpe=metrics.get('sharpe'),
+            max_drawdown=metrics.get('max_drawdown'),
+        )
+        if total_trades is not None:
+            record['win_rate'] = (metrics['wins'] / total_trades * 100) if total_trades > 0 else 0.0
+    return record
+
+def task_score(record, metric):
+    """A record's value for a selection metric; failed tasks and missing values rank last."""
+    value = record[metric] if record['status'] == 'Completed' else None
+    return float('-inf') if value is None else value
+
+def status_of(message):
+    """Status word ('Completed', 'SKIPPED' or 'ERROR') at the start of a result message."""
+    return message.split(' ', 1)[0].rstrip(':')
+
+class ResultsWriter:
+    """
+    Appends metrics records to a single Parquet file for the whole run.
+
+    Records are buffered and flushed as one row group every `batch_size`
+    records, so the driver never holds the full results table in memory.
+    """
+    def __init__(self, path, batch_size=RESULTS_BATCH_SIZE, schema=RESULT_SCHEMA):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.schema = schema
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self._buffer = []
+        self._writer = None
+
+    def add(self, records):
+        for record in records:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        table = pl.DataFrame(self._buffer, schema=self.schema).to_arrow()
+        if self._writer is None:
+            # Only the driver writes tables, so workers never import pyarrow
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        if self._writer is None:
+            # Still leave a readable, empty table behind
+            pl.DataFrame(schema=self.schema).write_parquet(self.path)
+        else:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,97 @@
+import numpy as np
+from multiprocessing import shared_memory
+from .data_preprocessor import BASE_TIMEFRAME, load_processed_data
+from .indicator_cache import data_fingerprint
+
+# Columns published for every company, each stored as one 8-byte-per-bar array
+PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+# Blocks this worker has already attached to, keyed by shared memory name
+_attached = {}
+
+class SharedCompanyData:
+    """Picklable handle describing one company's OHLCV arrays at one timeframe in shared memory."""
+    def __init__(self, company, shm_name, length, datetime_dtype, fingerprint, timeframe=BASE_TIMEFRAME):
+        self.company = company
+        self.timeframe = timeframe
+        self.shm_name = shm_name
+        self.length = length
+        self.datetime_dtype = datetime_dtype
+        self.fingerprint = fingerprint
+
+def _column_views(buffer, handle):
+    """Zero-copy, read-only NumPy views of every column inside a block."""
+    size = handle.length * 8
+    bars = {'datetime': np.ndarray(handle.length, dtype=handle.datetime_dtype, buffer=buffer)}
+    for i, col in enumerate(PRICE_COLUMNS, 1):
+        bars[col] = np.ndarray(handle.length, dtype=np.float64, buffer=buffer, offset=i * size)
+    for values in bars.values():
+        values.flags.writeable = False
+    bars['fingerprint'] = handle.fingerprint
+    return bars
+
+def publish_company(company, data, timeframe=BASE_TIMEFRAME):
+    """Copies a processed Polars frame into a new shared memory block."""
+    length = len(data)
+    datetimes = data['datetime'].to_numpy()
+    shm = shared_memory.SharedMemory(create=True, size=max(1, length * 8 * (len(PRICE_COLUMNS) + 1)))
+    handle = SharedCompanyData(company, shm.name, length, datetimes.dtype.str, None, timeframe)
+
+    bars = {'datetime': np.ndarray(length, dtype=datetimes.dtype, buffer=shm.buf)}
+    bars['datetime'][:] = datetimes
+    for i, col in enumerate(PRICE_COLUMNS, 1):
+        bars[col] = np.ndarray(length, dtype=np.float64, buffer=shm.buf, offset=i * length * 8)
+        bars[col][:] = data[col].to_numpy()
+    handle.fingerprint = data_fingerprint(bars)
+    del bars
+    return shm, handle
+
+def attach_company(handle):
+    """
+    Maps a published company into this worker, returning the same dict of
+    NumPy columns the vectorized engine builds from a Parquet file.
+    Each worker attaches to a block once and keeps it mapped.
+    """
+    if handle.shm_name not in _attached:
+        # Pool workers share the driver's resource tracker, which unlinks the
+        # block once, when the driver's SharedDataStore exits
+        shm = shared_memory.SharedMemory(name=handle.shm_name)
+        _attached[handle.shm_name] = (shm, _column_views(shm.buf, handle))
+    return dict(_attached[handle.shm_name][1])
+
+class SharedDataStore:
+    """
+    Driver-side owner of every published company block.
+
+    Use as a context manager: blocks are created by publish() and closed and
+    unlinked on exit, so peak memory grows with companies, not workers.
+    Handles are keyed by (company, timeframe).
+    """
+    def __init__(self):
+        self.handles = {}
+        self._blocks = []
+
+    def publish(self, keys):
+        for company, timeframe in keys:
+            data, message = load_processed_data(company, timeframe=timeframe)
+            if message:
+                # Workers fall back to reading the file and report the problem
+                continue
+            shm, handle = publish_company(company, data, timeframe)
+            self._blocks.append(shm)
+            self.handles[(company, timeframe)] = handle
+        return self.handles
+
+    @property
+    def nbytes(self):
+        return sum(shm.size for shm in self._blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for shm in self._blocks:
+            shm.close()
+            shm.unlink()
+        self._blocks.clear()
+        self.handles.clear()
@@ -0,0 +1,527 @@
+import json
+import math
+import time
+import socket
+from collections import deque, namedtuple
+import numpy as np
+import polars as pl
+from .config import INITIAL_CASH, COMMISSION
+from .data_preprocessor import BASE_TIMEFRAME, load_processed_data
+
+# Backtrader's default sizer buys a fixed stake of 1 unit per order
+STAKE = 1
+
+NAN = float('nan')
+
+# One bar of a stream. session_start is None when the source does not mark
+# sessions, in which case a change of calendar day starts one
+Bar = namedtuple('Bar', ['datetime', 'open', 'high', 'low', 'close', 'volume', 'session_start'])
+
+def _div(a, b):
+    """a / b with NumPy's float semantics (inf or NaN) instead of ZeroDivisionError."""
+    if b == 0:
+        return NAN if a == 0 or a != a else math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+# --- Incremental building blocks, each O(1) (amortized) per update ---
+
+def _add_exact(partials, x):
+    """Adds x to a list of non-overlapping partial sums whose total is exact (Shewchuk's algorithm, as math.fsum)."""
+    i = 0
+    for y in partials:
+        if abs(x) < abs(y):
+            x, y = y, x
+        hi = x + y
+        lo = y - (hi - x)
+        if lo:
+            partials[i] = lo
+            i += 1
+        x = hi
+    partials[i:] = [x]
+
+class _RollingMean:
+    """
+    Mean of the last `period` values, NaN until the window is full.
+    The window sum is kept exact, so it always equals math.fsum(window) as in
+    Backtrader's moving averages, however long the stream runs.
+    """
+    def __init__(self, period):
+        self.period = period
+        self.window = deque()
+        self.partials = []
+        self.nonfinite = 0
+
+    def update(self, x):
+        window = self.window
+        window.append(x)
+        if math.isfinite(x):
+            _add_exact(self.partials, x)
+        else:
+            self.nonfinite += 1
+        if len(window) > self.period:
+            old = window.popleft()
+            if math.isfinite(old):
+                _add_exact(self.partials, -old)
+            else:
+                self.nonfinite -= 1
+        if len(window) < self.period:
+            return NAN
+        if self.nonfinite:
+            return sum(window) / self.period
+        return math.fsum(self.partials) / self.period
+
+class _RollingExtreme:
+    """Highest (or lowest) of the last `period` values, using a monotonic deque."""
+    def __init__(self, period, highest=True):
+        self.period = period
+        self.sign = 1.0 if highest else -1.0
+        self.candidates = deque()
+        self.count = 0
+
+    def update(self, x):
+        key = self.sign * x
+        candidates = self.candidates
+        while candidates and candidates[-1][1] <= key:
+            candidates.pop()
+        candidates.append((self.count, key, x))
+        if candidates[0][0] <= self.count - self.period:
+            candidates.popleft()
+        self.count += 1
+        return candidates[0][2] if self.count >= self.period else NAN
+
+class _Smoothed:
+    """
+    Exponential smoothing seeded with the mean of the first `period` values
+    from the first valid one, updated exactly as pandas' ewm(adjust=False),
+    which the vectorized engine's EMA and SMMA use.
+    """
+    def __init__(self, period, alpha):
+        self.period = period
+        self.alpha = alpha
+        self.warmup = []
+        self.weighted = None
+        self.old_wt = 1.0
+
+    def update(self, x):
+        if self.weighted is None:
+            if not self.warmup and x != x:
+                return NAN
+            self.warmup.append(x)
+            if len(self.warmup) < self.period:
+                return NAN
+            self.weighted = float(np.mean(self.warmup))
+            self.warmup = None
+            return self.weighted
+        w = self.weighted
+        if w == w:
+            self.old_wt *= 1.0 - self.alpha
+            if x == x:
+                if w != x:
+                    w = (self.old_wt * w + self.alpha * x) / (self.old_wt + self.alpha)
+                self.old_wt = 1.0
+        elif x == x:
+            w = x
+        self.weighted = w
+        return w
+
+def _ema(period):
+    return _Smoothed(period, 2.0 / (period + 1))
+
+def _smma(period):
+    return _Smoothed(period, 1.0 / period)
+
+class _TrueRange:
+    """True range against the previous close, NaN on the first bar."""
+    def __init__(self):
+        self.prev_close = None
+
+    def update(self, bar):
+        prev, self.prev_close = self.prev_close, bar.close
+        if prev is None:
+            return NAN
+        return max(bar.high, prev) - min(bar.low, prev)
+
+def _band(line, lower, upper):
+    """Buy below the lower band, sell above the upper band."""
+    return 1 if line < lower else -1 if line > upper else 0
+
+def _cross(fast, slow):
+    """Buy while fast is above slow, sell while it is below."""
+    return 1 if fast > slow else -1 if fast < slow else 0
+
+# --- Incremental indicators, mirroring vectorized_engine.VECTORIZED_SIGNALS ---
+# Each keeps its own state, and update(bar) returns the bar's signal. minperiod
+# is the number of bars Backtrader needs before the indicator is ready.
+
+class _EMAState:
+    def __init__(self, period=30):
+        self.ema = _ema(period)
+        self.minperiod = period
+
+    def update(self, bar):
+        return _cross(bar.close, self.ema.update(bar.close))
+
+class _MACDState:
+    def __init__(self, period_me1=12, period_me2=26, period_signal=9):
+        self.fast, self.slow, self.signal = _ema(period_me1), _ema(period_me2), _ema(period_signal)
+        self.minperiod = period_me2 + period_signal - 1
+
+    def update(self, bar):
+        macd = self.fast.update(bar.close) - self.slow.update(bar.close)
+        return _cross(macd, self.signal.update(macd))
+
+class _ADXState:
+    def __init__(self, period=14):
+        self.true_range = _TrueRange()
+        self.atr, self.plus, self.minus, self.adx = _smma(period), _smma(period), _smma(period), _smma(period)
+        self.prev = None
+        self.minperiod = 2 * period
+
+    def update(self, bar):
+        if self.prev is None:
+            plus_dm = minus_dm = NAN
+        else:
+            upmove, downmove = bar.high - self.prev.high, self.prev.low - bar.low
+            plus_dm = upmove if upmove > downmove and upmove > 0.0 else 0.0
+            minus_dm = downmove if downmove > upmove and downmove > 0.0 else 0.0
+        self.prev = bar
+        atr = self.atr.update(self.true_range.update(bar))
+        di_plus = 100.0 * _div(self.plus.update(plus_dm), atr)
+        di_minus = 100.0 * _div(self.minus.update(minus_dm), atr)
+        dx = _div(abs(di_plus - di_minus), di_plus + di_minus)
+        return _cross(bar.close, 100.0 * self.adx.update(dx))
+
+class _SupertrendState:
+    def __init__(self, period=7, multiplier=3.0):
+        self.true_range, self.atr = _TrueRange(), _smma(period)
+        self.period, self.multiplier = period, multiplier
+        self.count = 0
+        self.value = NAN
+        self.prev_close = None
+        self.uptrend = True
+        self.minperiod = period + 1
+
+    def update(self, bar):
+        atr = self.atr.update(self.true_range.update(bar))
+        upper, lower = bar.high + self.multiplier * atr, bar.low - self.multiplier * atr
+        prev = self.value
+        if self.count >= self.period:
+            # Same branch order as indicator_kernels.supertrend_line, including its NaN handling
+            if self.uptrend:
+                if self.prev_close < prev:
+                    self.uptrend = False
+                    self.value = upper
+                else:
+                    self.value = max(lower, prev)
+            else:
+                if self.prev_close > prev:
+                    self.uptrend = True
+                    self.value = lower
+                else:
+                    self.value = min(upper, prev)
+        self.count += 1
+        self.prev_close = bar.close
+        return _cross(bar.close, self.value)
+
+class _RSIState:
+    def __init__(self, period=14):
+        self.up, self.down = _smma(period), _smma(period)
+        self.prev_close = None
+        self.minperiod = period + 1
+
+    def update(self, bar):
+        change = NAN if self.prev_close is None else bar.close - self.prev_close
+        self.prev_close = bar.close
+        up = self.up.update(NAN if change != change else max(change, 0.0))
+        down = self.down.update(NAN if change != change else max(-change, 0.0))
+        rs = _div(up, down)
+        return _band(100.0 - _div(100.0, 1.0 + rs), 30, 70)
+
+class _StochasticState:
+    def __init__(self, period=14, period_dfast=3, period_dslow=3):
+        self.highest, self.lowest = _RollingExtreme(period), _RollingExtreme(period, highest=False)
+        self.perc_k = _RollingMean(period_dfast)
+        self.minperiod = period + period_dfast + period_dslow - 2
+
+    def update(self, bar):
+        highest, lowest = self.highest.update(bar.high), self.lowest.update(bar.low)
+        if highest != highest:
+            return 0
+        fast_k = 100.0 * _div(bar.close - lowest, highest - lowest)
+        return _band(self.perc_k.update(fast_k), 20, 80)
+
+class _CCIState:
+    def __init__(self, period=20, factor=0.015):
+        self.mean, self.mean_dev = _RollingMean(period), _RollingMean(period)
+        self.factor = factor
+        self.minperiod = 2 * period - 1
+
+    def update(self, bar):
+        typical = (bar.high + bar.low + bar.close) / 3.0
+        mean = self.mean.update(typical)
+        if mean != mean:
+            return 0
+        mean_dev = self.mean_dev.update(abs(typical - mean))
+        return _band(_div(typical - mean, self.factor * mean_dev), -100, 100)
+
+class _WilliamsRState:
+    def __init__(self, period=14):
+        self.highest, self.lowest = _RollingExtreme(period), _RollingExtreme(period, highest=False)
+        self.minperiod = period
+
+    def update(self, bar):
+        highest, lowest = self.highest.update(bar.high), self.lowest.update(bar.low)
+        return _band(-100.0 * _div(highest - bar.close, highest - lowest), -80, -20)
+
+class _BollingerState:
+    def __init__(self, period=20, devfactor=2.0):
+        # Only the middle band (lines[0]) takes part in the signal
+        self.mid = _RollingMean(period)
+        self.minperiod = period
+
+    def update(self, bar):
+        return _cross(bar.close, self.mid.update(bar.close))
+
+class _ATRState:
+    def __init__(self, period=14):
+        self.true_range, self.atr = _TrueRange(), _smma(period)
+        self.minperiod = period + 1
+
+    def update(self, bar):
+        return _cross(bar.close, self.atr.update(self.true_range.update(bar)))
+
+class _OBVState:
+    def __init__(self):
+        self.obv = 0.0
+        self.prev_close = None
+        self.minperiod = 1
+
+    def update(self, bar):
+        if self.prev_close is not None:
+            if bar.close > self.prev_close:
+                self.obv += bar.volume
+            elif bar.close < self.prev_close:
+                self.obv -= bar.volume
+        self.prev_close = bar.close
+        return _cross(bar.close, self.obv)
+
+class _VWAPState:
+    def __init__(self):
+        self.tpv = self.volume = 0.0
+        self.day = None
+        self.minperiod = 1
+
+    def update(self, bar):
+        day = bar.datetime.date()
+        starts = bar.session_start if bar.session_start is not None else day != self.day
+        self.day = day
+        if starts:
+            self.tpv = self.volume = 0.0
+        self.tpv += (bar.high + bar.low + bar.close) / 3 * bar.volume
+        self.volume += bar.volume
+        vwap = self.tpv / self.volume if self.volume > 0 else bar.close
+        return _cross(bar.close, vwap)
+
+class _IchimokuState:
+    def __init__(self, tenkan=9, kijun=26, senkou=52, senkou_lead=26, chikou=26):
+        self.highest, self.lowest = _RollingExtreme(tenkan), _RollingExtreme(tenkan, highest=False)
+        # The senkou spans are pushed forward, delaying when Backtrader starts
+        self.minperiod = max(max(tenkan, kijun, senkou) + senkou_lead, chikou)
+
+    def update(self, bar):
+        tenkan_sen = (self.highest.update(bar.high) + self.lowest.update(bar.low)) / 2.0
+        return _cross(bar.close, tenkan_sen)
+
+class _PivotState:
+    def __init__(self, open=False, close=False):
+        self.open, self.close = open, close
+        self.minperiod = 1
+
+    def update(self, bar):
+        if self.close:
+            pivot = (bar.high + bar.low + 2.0 * bar.close) / 4.0
+        elif self.open:
+            pivot = (bar.high + bar.low + bar.close + bar.open) / 4.0
+        else:
+            pivot = (bar.high + bar.low + bar.close) / 3.0
+        return _cross(bar.close, pivot)
+
+class _FibonacciPivotState(_PivotState):
+    # The Fibonacci levels only shift s1..r3, the pivot line itself is shared
+    def __init__(self, open=False, close=False, level1=0.382, level2=0.618, level3=1.0):
+        super().__init__(open=open, close=close)
+
+STREAMING_INDICATORS = {
+    'EMA': _EMAState,
+    'MACD': _MACDState,
+    'ADX': _ADXState,
+    'Supertrend': _SupertrendState,
+    'RSI': _RSIState,
+    'Stochastic': _StochasticState,
+    'CCI': _CCIState,
+    'WilliamsR': _WilliamsRState,
+    'BollingerBands': _BollingerState,
+    'ATR': _ATRState,
+    'OnBalanceVolume': _OBVState,
+    'VWAP': _VWAPState,
+    'Ichimoku': _IchimokuState,
+    'FibonacciPivotPoint': _FibonacciPivotState,
+    'PivotPoint': _PivotState,
+}
+
+# --- Paper trading ---
+
+class PaperStrategy:
+    """
+    DualIndicatorStrategy's rules on a live stream, with a paper broker.
+
+    An order placed on a bar's close fills at the next bar's open, before
+    that bar's own decision, as Backtrader's market orders do; orders are
+    only placed once both indicators have warmed up.
+    """
+    def __init__(self, symbol, ind1_name, ind2_name, params1, params2, minperiod):
+        self.symbol = symbol
+        self.ind1_name, self.ind2_name = ind1_name, ind2_name
+        self.params1, self.params2 = params1, params2
+        self.label = f"{symbol} {ind1_name}{params1}/{ind2_name}{params2}"
+        self.minperiod = minperiod
+        self.bars = 0
+        self.cash = INITIAL_CASH
+        self.position = 0
+        self.entry_price = None
+        self.pending = None
+        self.last_close = None
+        self.total_trades = self.wins = self.losses = 0
+
+    def on_bar(self, bar, signal1, signal2):
+        """Advances one bar; returns 'BUY' or 'SELL' when an order is placed, else None."""
+        self.bars += 1
+        self.last_close = bar.close
+        if self.pending == 'BUY':
+            self.cash -= bar.open * STAKE * (1 + COMMISSION)
+            self.position, self.entry_price = STAKE, bar.open
+            self.total_trades += 1
+        elif self.pending == 'SELL':
+            self.cash += bar.open * STAKE * (1 - COMMISSION)
+            pnl = (bar.open - self.entry_price) * STAKE - (bar.open + self.entry_price) * STAKE * COMMISSION
+            if pnl >= 0.0:
+                self.wins += 1
+            else:
+                self.losses += 1
+            self.position, self.entry_price = 0, None
+        self.pending = None
+
+        if self.bars < self.minperiod:
+            return None
+        if not self.position:
+            if signal1 == 1 and signal2 == 1:
+                self.pending = 'BUY'
+        elif signal1 == -1 or signal2 == -1:
+            self.pending = 'SELL'
+        return self.pending
+
+    def value(self):
+        return self.cash + self.position * (self.last_close or 0.0)
+
+class StreamRunner:
+    """
+    Runs many (symbol, indicator pair, params) strategies over one bar stream
+    in a single process. Each distinct (symbol, indicator, params) state is
+    updated once per bar and shared by every strategy that uses it, so a bar
+    costs O(1) per indicator regardless of how much history came before.
+    Strategies must all be added before the first bar is fed.
+    Per-bar latency (indicator updates plus decisions) is recorded in ns.
+    """
+    def __init__(self):
+        self.indicators = {}
+        self.strategies = {}
+        self.latencies = []
+
+    def _indicator(self, symbol, name, params):
+        states = self.indicators.setdefault(symbol, {})
+        key = (name, json.dumps(params, sort_keys=True))
+        if key not in states:
+            states[key] = STREAMING_INDICATORS[name](**params)
+        return key, states[key]
+
+    def add(self, symbol, ind1_name, ind2_name, params1, params2):
+        key1, ind1 = self._indicator(symbol, ind1_name, params1)
+        key2, ind2 = self._indicator(symbol, ind2_name, params2)
+        strategy = PaperStrategy(symbol, ind1_name, ind2_name, params1, params2, max(ind1.minperiod, ind2.minperiod))
+        self.strategies.setdefault(symbol, []).append((strategy, key1, key2))
+        return strategy
+
+    def on_bar(self, symbol, bar):
+        """Feeds one bar; returns (strategy, action) for every order placed on it."""
+        start = time.perf_counter_ns()
+        states = self.indicators.get(symbol)
+        if states is None:
+            return []
+        signals = {key: state.update(bar) for key, state in states.items()}
+        events = []
+        for strategy, key1, key2 in self.strategies[symbol]:
+            action = strategy.on_bar(bar, signals[key1], signals[key2])
+            if action:
+                events.append((strategy, action))
+        self.latencies.append(time.perf_counter_ns() - start)
+        return events
+
+    def latency_summary(self):
+        """Per-bar latency percentiles in microseconds."""
+        if not self.latencies:
+            return {'bars': 0}
+        us = np.array(self.latencies) / 1e3
+        return {
+            'bars': len(us),
+            'mean_us': float(us.mean()),
+            'p50_us': float(np.percentile(us, 50)),
+            'p95_us': float(np.percentile(us, 95)),
+            'p99_us': float(np.percentile(us, 99)),
+            'max_us': float(us.max()),
+        }
+
+# --- Bar sources ---
+
+def replay_parquet(companies, timeframe=BASE_TIMEFRAME):
+    """Yields (symbol, Bar) from processed bar sets, merged into one time-ordered stream."""
+    frames = []
+    for company in companies:
+        data, message = load_processed_data(company, timeframe=timeframe)
+        if message:
+            print(message)
+            continue
+        if 'session_start' not in data.columns:
+            data = data.with_columns(session_start=pl.lit(None, pl.Boolean))
+        frames.append(data.with_columns(symbol=pl.lit(company)))
+    if not frames:
+        return
+    stream = pl.concat(frames).sort('datetime', maintain_order=True)
+    columns = ('symbol',) + Bar._fields
+    for row in stream.select(columns).iter_rows():
+        yield row[0], Bar(*row[1:])
+
+def parse_bar_lines(lines):
+    """
+    Yields (symbol, Bar) from JSON lines such as
+    {"symbol": "INT0", "datetime": "2024-01-02 09:15:00", "open": 1, "high": 1, "low": 1, "close": 1, "volume": 10}
+    with an optional "session_start". Blank lines are skipped.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        msg = json.loads(line)
+        yield msg['symbol'], Bar(
+            datetime=np.datetime64(msg['datetime'], 'us').astype(object),
+            open=float(msg['open']), high=float(msg['high']), low=float(msg['low']),
+            close=float(msg['close']), volume=float(msg['volume']),
+            session_start=msg.get('session_start'),
+        )
+
+def socket_lines(host, port):
+    """Accepts one connection on host:port and yields its lines: a local stand-in for a live feed."""
+    with socket.create_server((host, port)) as server:
+        print(f"Waiting for a bar feed on {host}:{port}")
+        conn, _ = server.accept()
+        with conn, conn.makefile('r') as stream:
+            yield from stream
@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from .results_table import METRIC_GROUPS, task_record
+from .task_runner import init_worker, run_company_batch
+
+# Seconds a worker may hold a batch without renewing its lease
+LEASE_SECONDS = 300
+# Times a batch is handed out before it is given up on
+MAX_ATTEMPTS = 3
+# Seconds a connection waits for another process's write lock
+BUSY_TIMEOUT = 60
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _task_to_json(task):
+    company, (ind1_name, ind2_name), params1, params2, timeframe = task
+    return [company, [ind1_name, ind2_name], params1, params2, timeframe]
+
+def _task_from_json(item):
+    company, (ind1_name, ind2_name), params1, params2, timeframe = item
+    return company, (ind1_name, ind2_name), params1, params2, timeframe
+
+class TaskQueue:
+    """
+    Durable queue of task batches in a SQLite file, shared by one coordinator
+    and any number of workers on any number of hosts.
+
+    A worker leases a batch for LEASE_SECONDS and renews the lease while it
+    runs. A batch whose lease runs out (its worker died or lost the share)
+    goes back to the next worker that asks, up to MAX_ATTEMPTS times.
+    Result records are written back under their task hash, and only by the
+    worker that still holds the batch's lease, so a batch that was run
+    twice still yields one row per task.
+    """
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        # Autocommit mode; every write below opens its own IMMEDIATE transaction
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS batches (
+                batch_id INTEGER PRIMARY KEY,
+                engine TEXT, company TEXT, timeframe TEXT,
+                tasks TEXT, task_hashes TEXT, metric_groups TEXT,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                lease_owner TEXT, lease_expires REAL,
+                last_error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS batch_tasks (
+                task_hash TEXT PRIMARY KEY,
+                batch_id INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                task_hash TEXT PRIMARY KEY,
+                batch_id INTEGER,
+                status TEXT,
+                record TEXT
+            );
+        """)
+
+    def _write(self, sql, params=()):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = self.conn.execute(sql, params)
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return cursor
+
+    def enqueue(self, batches, metric_groups=tuple(METRIC_GROUPS)):
+        """
+        Adds (engine, company, timeframe, tasks, task_hashes) batches in one
+        transaction, each to be run with the given optional metric groups.
+        Tasks the queue already holds in a pending or leased batch, or has a
+        Completed result for, are left out, so the same sweep can be queued
+        again after a restart; stale results of the others are dropped.
+        Returns the number of batches added.
+        """
+        groups = json.dumps(sorted(metric_groups))
+        added = 0
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            queued = {key for (key,) in self.conn.execute("""
+                SELECT t.task_hash FROM batch_tasks t JOIN batches b ON b.batch_id = t.batch_id
+                WHERE b.status IN ('pending', 'leased')
+                UNION SELECT task_hash FROM results WHERE status = 'Completed'
+            """)}
+            for engine_name, company, timeframe, tasks, keys in batches:
+                new = [(task, key) for task, key in zip(tasks, keys) if key not in queued]
+                if not new:
+                    continue
+                tasks, keys = [task for task, _ in new], [key for _, key in new]
+                cursor = self.conn.execute(
+                    "INSERT INTO batches (engine, company, timeframe, tasks, task_hashes, metric_groups) VALUES (?, ?, ?, ?, ?, ?)",
+                    (engine_name, company, timeframe, json.dumps([_task_to_json(t) for t in tasks]), json.dumps(keys), groups),
+                )
+                self.conn.executemany("INSERT OR REPLACE INTO batch_tasks (task_hash, batch_id) VALUES (?, ?)",
+                                      [(key, cursor.lastrowid) for key in keys])
+                self.conn.executemany("DELETE FROM results WHERE task_hash = ?", [(key,) for key in keys])
+                queued.update(keys)
+                added += 1
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return added
+
+    def lease(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """
+        Claims the oldest pending batch, or one whose lease has expired.
+        Returns (batch_id, engine, company, timeframe, tasks, task_hashes, metric_groups) or None.
+        """
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute("""
+                SELECT batch_id, engine, company, timeframe, tasks, task_hashes, metric_groups FROM batches
+                WHERE attempts < ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                ORDER BY batch_id LIMIT 1
+            """, (MAX_ATTEMPTS, now)).fetchone()
+            if row is not None:
+                self.conn.execute("""
+                    UPDATE batches SET status = 'leased', attempts = attempts + 1,
+                        lease_owner = ?, lease_expires = ?
+                    WHERE batch_id = ?
+                """, (worker_id, now + lease_seconds, row[0]))
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        batch_id, engine_name, company, timeframe, tasks, keys, groups = row
+        tasks = [_task_from_json(t) for t in json.loads(tasks)]
+        return batch_id, engine_name, company, timeframe, tasks, json.loads(keys), json.loads(groups)
+
+    def renew(self, batch_id, worker_id, lease_seconds=LEASE_SECONDS):
+        """Extends a lease this worker still holds; returns False if it was lost."""
+        cursor = self._write(
+            "UPDATE batches SET lease_expires = ? WHERE batch_id = ? AND status = 'leased' AND lease_owner = ?",
+            (time.time() + lease_seconds, batch_id, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, batch_id, worker_id, rows):
+        """
+        Stores (task_hash, record) rows and marks the batch done, if this
+        worker still holds its lease. Returns False, storing nothing, if the
+        lease was lost, e.g. it expired and another worker took the batch.
+        """
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = self.conn.execute("""
+                UPDATE batches SET status = 'done', lease_owner = NULL
+                WHERE batch_id = ? AND status = 'leased' AND lease_owner = ?
+            """, (batch_id, worker_id))
+            if cursor.rowcount == 1:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO results (task_hash, batch_id, status, record) VALUES (?, ?, ?, ?)",
+                    [(key, batch_id, record['status'], json.dumps(record)) for key, record in rows],
+                )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def release(self, batch_id, worker_id, error):
+        """
+        Hands a batch that raised back to the queue, or, after MAX_ATTEMPTS,
+        fails it and stores an ERROR record for each of its tasks.
+        """
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute("""
+                SELECT attempts, tasks, task_hashes FROM batches
+                WHERE batch_id = ? AND status = 'leased' AND lease_owner = ?
+            """, (batch_id, worker_id)).fetchone()
+            if row is not None:
+                attempts, tasks, keys = row
+                if attempts >= MAX_ATTEMPTS:
+                    message = f"ERROR: Batch {batch_id} failed on all {MAX_ATTEMPTS} attempts: {error}"
+                    self._fail(batch_id, tasks, keys, message)
+                else:
+                    self.conn.execute(
+                        "UPDATE batches SET status = 'pending', lease_owner = NULL, last_error = ? WHERE batch_id = ?",
+                        (error, batch_id))
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def _fail(self, batch_id, tasks, keys, message):
+        """
+        Marks a batch failed and stores an ERROR record for each of its tasks,
+        inside the caller's transaction. Returns the (task_hash, record) rows.
+        """
+        self.conn.execute(
+            "UPDATE batches SET status = 'failed', lease_owner = NULL, last_error = ? WHERE batch_id = ?",
+            (message, batch_id))
+        failed = []
+        for item, key in zip(json.loads(tasks), json.loads(keys)):
+            record = task_record(_task_from_json(item), 'ERROR', message)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (task_hash, batch_id, status, record) VALUES (?, ?, ?, ?)",
+                (key, batch_id, record['status'], json.dumps(record)))
+            failed.append((key, record))
+        return failed
+
+    def reap(self):
+        """
+        Fails batches whose last allowed lease has expired and returns their
+        (task_hash, ERROR record) rows, so the coordinator can record them.
+        """
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.conn.execute("""
+                SELECT batch_id, tasks, task_hashes FROM batches
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?
+            """, (now, MAX_ATTEMPTS)).fetchall()
+            failed = []
+            for batch_id, tasks, keys in rows:
+                message = f"ERROR: Batch {batch_id} was abandoned by {MAX_ATTEMPTS} workers."
+                failed.extend(self._fail(batch_id, tasks, keys, message))
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return failed
+
+    def results_after(self, rowid):
+        """Yields (rowid, task_hash, record) for results stored after `rowid`."""
+        rows = self.conn.execute(
+            "SELECT rowid, task_hash, record FROM results WHERE rowid > ? ORDER BY rowid", (rowid,))
+        for row_id, key, record in rows:
+            yield row_id, key, json.loads(record)
+
+    def counts(self):
+        """Number of batches in each status."""
+        counts = dict.fromkeys(('pending', 'leased', 'done', 'failed'), 0)
+        counts.update(self.conn.execute("SELECT status, COUNT(*) FROM batches GROUP BY status"))
+        return counts
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _LeaseRenewer(threading.Thread):
+    """Renews a batch's lease in the background while the worker runs it."""
+    def __init__(self, path, batch_id, worker_id, lease_seconds):
+        super().__init__(daemon=True)
+        self.path, self.batch_id, self.worker_id, self.lease_seconds = path, batch_id, worker_id, lease_seconds
+        self.stopped = threading.Event()
+
+    def run(self):
+        # SQLite connections cannot cross threads, so this one opens its own
+        with TaskQueue(self.path) as queue:
+            while not self.stopped.wait(self.lease_seconds / 3):
+                if not queue.renew(self.batch_id, self.worker_id, self.lease_seconds):
+                    return
+
+def run_worker(queue_path, worker_id=None, lease_seconds=LEASE_SECONDS, poll_seconds=5.0, exit_when_idle=True):
+    """
+    Pulls batches from the queue until it is drained, running each through
+    the same run_company_batch path as the local process pool.
+    With exit_when_idle=False the worker keeps polling for new batches.
+    Returns the number of batches this worker completed.
+    """
+    worker_id = worker_id or default_worker_id()
+    completed = 0
+    with TaskQueue(queue_path) as queue:
+        while True:
+            leased = queue.lease(worker_id, lease_seconds)
+            if leased is None:
+                counts = queue.counts()
+                if exit_when_idle and counts['pending'] == 0 and counts['leased'] == 0:
+                    break
+                # Other workers still hold leases that may expire and come back
+                time.sleep(poll_seconds)
+                continue
+
+            batch_id, engine_name, company, timeframe, tasks, keys, groups = leased
+            # Cheap after the first batch: imports are cached, only the metric groups change
+            init_worker(engine_name, groups)
+            renewer = _LeaseRenewer(queue_path, batch_id, worker_id, lease_seconds)
+            renewer.start()
+            try:
+                results, _ = run_company_batch((engine_name, company, timeframe, tasks, None, None))
+            except Exception as e:
+                queue.release(batch_id, worker_id, f"{type(e).__name__}: {e}")
+                print(f"[{worker_id}] Batch {batch_id} failed: {e}")
+                continue
+            finally:
+                renewer.stopped.set()
+                renewer.join()
+            if not queue.complete(batch_id, worker_id, [(key, record) for key, (_, record) in zip(keys, results)]):
+                # Another worker took the batch over; its results are the ones kept
+                print(f"[{worker_id}] Batch {batch_id}: lease lost, results dropped")
+                continue
+            completed += 1
+            print(f"[{worker_id}] Batch {batch_id}: {len(tasks)} tasks for {company} {timeframe} done")
+    return completed
@@ -0,0 +1,101 @@
+import os
+import time
+from .config import INDICATORS
+from .lazy_registry import LazyRegistry
+from .data_preprocessor import load_processed_data
+from .shared_data import attach_company
+from .results_table import METRIC_GROUPS, task_record, status_of, set_metric_groups
+from .profiling import StageTimer, peak_rss_mb, profile_call
+
+# --- Backtesting engines selectable from the command line ---
+# Imported on first use, so a run only loads the engine (and, for
+# 'backtrader', the Backtrader package) it actually runs on
+ENGINES = LazyRegistry({
+    'backtrader': '.backtesting_engine',
+    'vectorized': '.vectorized_engine',
+}, package=__package__)
+
+# Stages timed for every batch, in pipeline order. 'indicators' and
+# 'analyzers' are only split out of 'backtest' when the run is instrumented
+STAGES = ('load', 'prepare', 'indicators', 'backtest', 'analyzers')
+
+def init_worker(engine_name, metric_groups=tuple(METRIC_GROUPS)):
+    """
+    Pool initializer: imports the engine and, for Backtrader, every indicator
+    class once while the worker starts, instead of inside its first task,
+    and sets the optional metrics every task of the run computes.
+    """
+    ENGINES[engine_name]
+    if engine_name == 'backtrader':
+        INDICATORS.resolve_all()
+    set_metric_groups(metric_groups)
+
+def _task_label(task):
+    company, (ind1_name, ind2_name), params1, params2, timeframe = task
+    return f"{company} {timeframe} {ind1_name}{params1}/{ind2_name}{params2}"
+
+def run_company_batch(args):
+    """
+    Worker entry point for a batch of tasks that all belong to one company
+    and timeframe.
+
+    The company's bars at that timeframe are loaded and converted for the engine once, then every
+    task in the batch runs on that copy. When the driver published the company
+    in shared memory, `shared` is its SharedCompanyData handle and the worker
+    attaches to those arrays instead of reading the Parquet file.
+
+    `instrument` is None, or a dict turning on per-task timing: 'offset' is
+    the run-wide index of the batch's first task, and every 'profile_every'-th
+    task is run under cProfile with its stats written to 'profile_dir'.
+    Returns (results, stats): results pairs every task with its metrics
+    record; stats holds wall/CPU seconds per stage and, when instrumented,
+    per-task timings and the worker's peak RSS. Each task's 'stages' splits
+    its time the same way; load and prepare run once per batch, so every
+    task carries an equal share of them.
+    """
+    engine_name, company, timeframe, tasks, shared, instrument = args
+    engine = ENGINES[engine_name]
+    timer = StageTimer()
+    stats = {'stages': timer.totals}
+
+    with timer.stage('load'):
+        if shared is not None:
+            data, message = attach_company(shared), None
+        else:
+            data, message = load_processed_data(company, timeframe=timeframe)
+    if message:
+        return [(task, task_record(task, status_of(message), message)) for task in tasks], stats
+
+    try:
+        with timer.stage('prepare'):
+            prepared = engine.prepare_data(data)
+    except Exception as e:
+        message = f"ERROR preparing data for {company}: {e}"
+        return [(task, task_record(task, 'ERROR', message)) for task in tasks], stats
+
+    if instrument is None:
+        with timer.stage('backtest'):
+            results = [(task, engine.run_backtest_task(task, prepared)) for task in tasks]
+        return results, stats
+
+    results, task_stats = [], []
+    every = instrument.get('profile_every') or 0
+    shared_stages = {stage: [wall / len(tasks), cpu / len(tasks)] for stage, (wall, cpu) in timer.totals.items()}
+    for i, task in enumerate(tasks, instrument['offset']):
+        profiled = every > 0 and i % every == 0
+        before = timer.snapshot()
+        wall, cpu = time.perf_counter(), time.process_time()
+        with timer.stage('backtest'):
+            if profiled:
+                path = os.path.join(instrument['profile_dir'], f"task_{i:06d}.prof")
+                record = profile_call(path, engine.run_backtest_task, task, prepared, timer)
+            else:
+                record = engine.run_backtest_task(task, prepared, timer)
+        task_stats.append({
+            'index': i, 'label': _task_label(task), 'profiled': profiled,
+            'wall': time.perf_counter() - wall, 'cpu': time.process_time() - cpu,
+            'stages': dict(shared_stages, **timer.since(before)),
+        })
+        results.append((task, record))
+    stats.update(tasks=task_stats, pid=os.getpid(), rss_mb=peak_rss_mb())
+    return results, stats
@@ -0,0 +1,346 @@
+import math
+import numpy as np
+import pandas as pd
+import polars as pl
+from numpy.lib.stride_tricks import sliding_window_view
+from .results_table import task_record, status_of, metric_groups
+from .config import INITIAL_CASH, COMMISSION, INDICATOR_CACHE_MAX_MB
+from .indicator_kernels import supertrend_line, obv_line, vwap_line, day_starts
+from .indicator_cache import IndicatorCache, cache_key, data_fingerprint
+from .data_preprocessor import load_processed_data
+from .profiling import NULL_TIMER
+
+# Backtrader's default sizer buys a fixed stake of 1 unit per order
+STAKE = 1
+# Annualization factor used by bt.analyzers.SharpeRatio for daily returns
+DAYS_PER_YEAR = 252
+
+# Shared by every task a worker process runs
+indicator_cache = IndicatorCache(INDICATOR_CACHE_MAX_MB * 1024 * 1024)
+
+# --- Array helpers reproducing the Backtrader moving averages and windows ---
+
+def _rolling(values, period, func):
+    """Applies func over a trailing window, leaving the warm-up bars as NaN."""
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        out[period - 1:] = func(sliding_window_view(values, period), axis=1)
+    return out
+
+def _sma(values, period):
+    return _rolling(values, period, np.mean)
+
+def _highest(values, period):
+    return _rolling(values, period, np.max)
+
+def _lowest(values, period):
+    return _rolling(values, period, np.min)
+
+def _smoothed(values, period, alpha):
+    """
+    Exponential smoothing seeded with the SMA of the first `period` valid
+    values, which is how Backtrader's EMA and SMMA warm up.
+    """
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) < period:
+        return out
+    seed_idx = valid[0] + period - 1
+    seeded = values.copy()
+    seeded[:seed_idx] = np.nan
+    seeded[seed_idx] = values[valid[0]:seed_idx + 1].mean()
+    out[seed_idx:] = pd.Series(seeded[seed_idx:]).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return out
+
+def _ema(values, period):
+    return _smoothed(values, period, 2.0 / (period + 1))
+
+def _smma(values, period):
+    return _smoothed(values, period, 1.0 / period)
+
+def _shifted_diff(values):
+    """values[i] - values[i - 1], NaN on the first bar."""
+    out = np.full(len(values), np.nan)
+    out[1:] = values[1:] - values[:-1]
+    return out
+
+def _atr(bars, period):
+    prev_close = np.roll(bars['close'], 1)
+    true_range = np.maximum(bars['high'], prev_close) - np.minimum(bars['low'], prev_close)
+    true_range[0] = np.nan
+    return _smma(true_range, period)
+
+# --- Signal rules, mirroring DualIndicatorStrategy._get_signal ---
+
+def _band_signal(line, lower, upper):
+    """Buy below the lower band, sell above the upper band."""
+    return np.where(line < lower, 1, np.where(line > upper, -1, 0))
+
+def _cross_signal(fast, slow):
+    """Buy while fast is above slow, sell while it is below."""
+    return np.where(fast > slow, 1, np.where(fast < slow, -1, 0))
+
+# Each function returns (signal array, minimum period) where the minimum
+# period is the number of bars Backtrader needs before the indicator is ready.
+
+def _ema_signal(bars, period=30):
+    return _cross_signal(bars['close'], _ema(bars['close'], period)), period
+
+def _macd_signal(bars, period_me1=12, period_me2=26, period_signal=9):
+    macd = _ema(bars['close'], period_me1) - _ema(bars['close'], period_me2)
+    signal = _ema(macd, period_signal)
+    return _cross_signal(macd, signal), period_me2 + period_signal - 1
+
+def _adx_signal(bars, period=14):
+    upmove = _shifted_diff(bars['high'])
+    downmove = -_shifted_diff(bars['low'])
+    plus_dm = np.where((upmove > downmove) & (upmove > 0.0), upmove, 0.0)
+    minus_dm = np.where((downmove > upmove) & (downmove > 0.0), downmove, 0.0)
+    plus_dm[0] = minus_dm[0] = np.nan
+    atr = _atr(bars, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        di_plus = 100.0 * _smma(plus_dm, period) / atr
+        di_minus = 100.0 * _smma(minus_dm, period) / atr
+        dx = np.abs(di_plus - di_minus) / (di_plus + di_minus)
+    adx = 100.0 * _smma(dx, period)
+    return _cross_signal(bars['close'], adx), 2 * period
+
+def _supertrend_signal(bars, period=7, multiplier=3.0):
+    atr = _atr(bars, period)
+    upper_band = bars['high'] + multiplier * atr
+    lower_band = bars['low'] - multiplier * atr
+    supertrend = supertrend_line(bars['close'], upper_band, lower_band, period)
+    return _cross_signal(bars['close'], supertrend), period + 1
+
+def _rsi_signal(bars, period=14):
+    change = _shifted_diff(bars['close'])
+    up = np.where(np.isnan(change), np.nan, np.maximum(change, 0.0))
+    down = np.where(np.isnan(change), np.nan, np.maximum(-change, 0.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = _smma(up, period) / _smma(down, period)
+        rsi = 100.0 - 100.0 / (1.0 + rs)
+    return _band_signal(rsi, 30, 70), period + 1
+
+def _stochastic_signal(bars, period=14, period_dfast=3, period_dslow=3):
+    highest = _highest(bars['high'], period)
+    lowest = _lowest(bars['low'], period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fast_k = 100.0 * (bars['close'] - lowest) / (highest - lowest)
+    perc_k = np.full(len(fast_k), np.nan)
+    perc_k[period - 1:] = _sma(fast_k[period - 1:], period_dfast)
+    return _band_signal(perc_k, 20, 80), period + period_dfast + period_dslow - 2
+
+def _cci_signal(bars, period=20, factor=0.015):
+    typical = (bars['high'] + bars['low'] + bars['close']) / 3.0
+    mean = _sma(typical, period)
+    mean_dev = np.full(len(typical), np.nan)
+    mean_dev[period - 1:] = _sma(np.abs(typical - mean)[period - 1:], period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cci = (typical - mean) / (factor * mean_dev)
+    return _band_signal(cci, -100, 100), 2 * period - 1
+
+def _williamsr_signal(bars, period=14):
+    highest = _highest(bars['high'], period)
+    lowest = _lowest(bars['low'], period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        perc_r = -100.0 * (highest - bars['close']) / (highest - lowest)
+    return _band_signal(perc_r, -80, -20), period
+
+def _bollinger_signal(bars, period=20, devfactor=2.0):
+    # Only the middle band (lines[0]) takes part in the signal
+    return _cross_signal(bars['close'], _sma(bars['close'], period)), period
+
+def _atr_signal(bars, period=14):
+    return _cross_signal(bars['close'], _atr(bars, period)), period + 1
+
+def _obv_signal(bars):
+    return _cross_signal(bars['close'], obv_line(bars['close'], bars['volume'])), 1
+
+def _vwap_signal(bars):
+    starts = bars.get('day_starts')
+    if starts is None:
+        starts = day_starts(bars['datetime'].astype('datetime64[D]'))
+    vwap = vwap_line(bars['high'], bars['low'], bars['close'], bars['volume'], starts)
+    return _cross_signal(bars['close'], vwap), 1
+
+def _ichimoku_signal(bars, tenkan=9, kijun=26, senkou=52, senkou_lead=26, chikou=26):
+    tenkan_sen = (_highest(bars['high'], tenkan) + _lowest(bars['low'], tenkan)) / 2.0
+    # The senkou spans are pushed forward, delaying when Backtrader starts
+    return _cross_signal(bars['close'], tenkan_sen), max(max(tenkan, kijun, senkou) + senkou_lead, chikou)
+
+def _pivot_signal(bars, open=False, close=False):
+    high, low, cl = bars['high'], bars['low'], bars['close']
+    if close:
+        pivot = (high + low + 2.0 * cl) / 4.0
+    elif open:
+        pivot = (high + low + cl + bars['open']) / 4.0
+    else:
+        pivot = (high + low + cl) / 3.0
+    return _cross_signal(cl, pivot), 1
+
+def _fibonacci_pivot_signal(bars, open=False, close=False, level1=0.382, level2=0.618, level3=1.0):
+    # The Fibonacci levels only shift s1..r3, the pivot line itself is shared
+    return _pivot_signal(bars, open=open, close=close)
+
+VECTORIZED_SIGNALS = {
+    'EMA': _ema_signal,
+    'MACD': _macd_signal,
+    'ADX': _adx_signal,
+    'Supertrend': _supertrend_signal,
+    'RSI': _rsi_signal,
+    'Stochastic': _stochastic_signal,
+    'CCI': _cci_signal,
+    'WilliamsR': _williamsr_signal,
+    'BollingerBands': _bollinger_signal,
+    'ATR': _atr_signal,
+    'OnBalanceVolume': _obv_signal,
+    'VWAP': _vwap_signal,
+    'Ichimoku': _ichimoku_signal,
+    'FibonacciPivotPoint': _fibonacci_pivot_signal,
+    'PivotPoint': _pivot_signal,
+}
+
+# --- Trade simulation ---
+
+def bars_from_polars(data):
+    """Converts a processed Polars frame into a dict of NumPy columns."""
+    bars = {col: data[col].to_numpy().astype(np.float64) for col in ('open', 'high', 'low', 'close', 'volume')}
+    bars['datetime'] = data['datetime'].to_numpy()
+    if 'session_start' in data.columns:
+        # Precomputed by the preprocessor; a window that opens mid-day still starts a session
+        bars['day_starts'] = np.union1d([0], np.flatnonzero(data['session_start'].to_numpy()))
+    return bars
+
+def prepare_data(data):
+    """
+    Converts a Polars frame to NumPy columns and fingerprints them once.
+    Columns attached from shared memory already arrive in this form.
+    """
+    if isinstance(data, dict):
+        return data
+    bars = bars_from_polars(data)
+    bars['fingerprint'] = data_fingerprint(bars)
+    return bars
+
+def simulate_long_only(bars, signal1, signal2, start, groups=None, timer=NULL_TIMER):
+    """
+    Replays the DualIndicatorStrategy rules on precomputed signal arrays.
+
+    Orders are placed on a bar's close and filled at the next bar's open,
+    exactly like Backtrader's default market orders. Returns a dict with the
+    final value and the optional metric groups (default: the worker's
+    metric_groups()): trade counts, Sharpe ratio and max drawdown, timed as
+    the 'analyzers' stage of timer.
+    """
+    groups = metric_groups() if groups is None else groups
+    opens, closes = bars['open'], bars['close']
+    n = len(closes)
+    buy_bars = np.flatnonzero((signal1 == 1) & (signal2 == 1))
+    sell_bars = np.flatnonzero((signal1 == -1) | (signal2 == -1))
+
+    entries, exits = [], []
+    bar = start
+    while True:
+        k = np.searchsorted(buy_bars, bar)
+        if k == len(buy_bars) or buy_bars[k] + 1 >= n:
+            break
+        entry = buy_bars[k] + 1
+        entries.append(entry)
+        # The position is visible to the strategy from the fill bar onwards
+        k = np.searchsorted(sell_bars, entry)
+        if k == len(sell_bars) or sell_bars[k] + 1 >= n:
+            break
+        exits.append(sell_bars[k] + 1)
+        bar = exits[-1]
+
+    entries, exits = np.array(entries, dtype=np.int64), np.array(exits, dtype=np.int64)
+    cash_flow = np.zeros(n)
+    position = np.zeros(n)
+    np.add.at(cash_flow, entries, -opens[entries] * STAKE * (1 + COMMISSION))
+    np.add.at(cash_flow, exits, opens[exits] * STAKE * (1 - COMMISSION))
+    np.add.at(position, entries, STAKE)
+    np.add.at(position, exits, -STAKE)
+    value = INITIAL_CASH + np.cumsum(cash_flow) + np.cumsum(position) * closes
+
+    metrics = {'final_value': float(value[-1]) if n else INITIAL_CASH}
+    with timer.stage('analyzers'):
+        if 'trades' in groups:
+            closed_entries = entries[:len(exits)]
+            trade_pnl = (opens[exits] - opens[closed_entries]) * STAKE \
+                - (opens[exits] + opens[closed_entries]) * STAKE * COMMISSION
+            wins = int(np.count_nonzero(trade_pnl >= 0.0))
+            metrics.update(total_trades=len(entries), wins=wins, losses=len(exits) - wins)
+        if 'sharpe' in groups:
+            metrics['sharpe'] = _daily_sharpe(bars['datetime'], value)
+        if 'drawdown' in groups:
+            peak = np.maximum.accumulate(value)
+            metrics['max_drawdown'] = float(np.max(100.0 * (peak - value) / peak)) if n else 0.0
+    return metrics
+
+def _daily_sharpe(datetimes, value):
+    """Annualized Sharpe ratio of end-of-day returns, as bt.analyzers.SharpeRatio."""
+    if not len(value):
+        return None
+    days = datetimes.astype('datetime64[D]')
+    day_ends = np.append(np.flatnonzero(days[1:] != days[:-1]), len(days) - 1)
+    day_values = np.concatenate(([INITIAL_CASH], value[day_ends]))
+    returns = day_values[1:] / day_values[:-1] - 1.0
+    deviation = returns.std()
+    if deviation == 0:
+        return None
+    return math.sqrt(DAYS_PER_YEAR) * returns.mean() / deviation
+
+def indicator_signal(bars, indicator_name, params):
+    """Computes one indicator's (signal, minperiod), storing the signal compactly."""
+    signal, minperiod = VECTORIZED_SIGNALS[indicator_name](bars, **params)
+    return signal.astype(np.int8), minperiod
+
+def compute_signals(bars, ind1_name, ind2_name, params1, params2, cache=None, company=None):
+    """
+    Builds both signal arrays and the first bar the strategy may trade on.
+    When a cache is given, series already computed for this company are reused.
+    """
+    if cache is None:
+        signal1, minperiod1 = indicator_signal(bars, ind1_name, params1)
+        signal2, minperiod2 = indicator_signal(bars, ind2_name, params2)
+    else:
+        fingerprint = bars.get('fingerprint') or data_fingerprint(bars)
+        signal1, minperiod1 = cache.get_or_compute(
+            cache_key(company, ind1_name, params1, fingerprint),
+            lambda: indicator_signal(bars, ind1_name, params1))
+        signal2, minperiod2 = cache.get_or_compute(
+            cache_key(company, ind2_name, params2, fingerprint),
+            lambda: indicator_signal(bars, ind2_name, params2))
+    minperiod = max(minperiod1, minperiod2)
+    if minperiod > len(bars['close']):
+        # Backtrader's batch indicators fail outright when the data is shorter than their warm-up
+        raise IndexError(f"{len(bars['close'])} bars are fewer than the {minperiod} the indicators need")
+    return signal1, signal2, minperiod - 1
+
+def vectorized_backtest_metrics(data, ind1_name, ind2_name, params1, params2, cache=None, company=None,
+                                timer=NULL_TIMER):
+    """Runs one indicator pair over a Polars frame (or prepared bars) and returns its metrics."""
+    bars = prepare_data(data) if isinstance(data, pl.DataFrame) else data
+    with timer.stage('indicators'):
+        signal1, signal2, start = compute_signals(bars, ind1_name, ind2_name, params1, params2, cache, company)
+    return simulate_long_only(bars, signal1, signal2, start, timer=timer)
+
+def run_backtest_task(task, data, timer=NULL_TIMER):
+    """Runs one task on loaded (optionally prepared) company data and returns its metrics record."""
+    company, (ind1_name, ind2_name), params1, params2, timeframe = task
+    try:
+        metrics = vectorized_backtest_metrics(
+            data, ind1_name, ind2_name, params1, params2,
+            cache=indicator_cache, company=company, timer=timer,
+        )
+        pnl = metrics['final_value'] - INITIAL_CASH
+        message = f"Completed: {company} {timeframe} {ind1_name}/{ind2_name} with PNL: {pnl:.2f}"
+        return task_record(task, 'Completed', message, metrics, INITIAL_CASH)
+    except Exception as e:
+        return task_record(task, 'ERROR', f"ERROR during backtest for {company} {timeframe} with {ind1_name}/{ind2_name}: {e}")
+
+def run_vectorized_backtest(args):
+    """Drop-in replacement for run_single_backtest built on NumPy arrays."""
+    data, message = load_processed_data(args[0], timeframe=args[4])
+    if message: return task_record(args, status_of(message), message)
+    return run_backtest_task(args, data)
@@ -0,0 +1,129 @@
+from collections import namedtuple
+from datetime import datetime
+import polars as pl
+from .data_preprocessor import BASE_TIMEFRAME, load_processed_data, processed_path
+from .results_table import RESULT_SCHEMA, task_record, task_score
+from .task_runner import ENGINES
+
+# One train/test split: optimize on [train_start, test_start), evaluate on [test_start, test_end)
+Fold = namedtuple('Fold', ['index', 'train_start', 'test_start', 'test_end'])
+
+WALK_FORWARD_SCHEMA = {
+    'fold': pl.Int64,
+    'train_start': pl.Datetime,
+    'test_start': pl.Datetime,
+    'test_end': pl.Datetime,
+    'train_score': pl.Float64,
+    **RESULT_SCHEMA,
+}
+
+def _add_months(month_start, months):
+    month_index = month_start.month - 1 + months
+    return month_start.replace(year=month_start.year + month_index // 12, month=month_index % 12 + 1)
+
+def compute_folds(first, last, train_months, test_months):
+    """
+    Rolling monthly folds covering [first, last]. Each fold trains on
+    train_months calendar months and tests on the following test_months;
+    the window then rolls forward by test_months.
+    """
+    folds = []
+    train_start = datetime(first.year, first.month, 1)
+    while True:
+        test_start = _add_months(train_start, train_months)
+        if test_start > last:
+            break
+        folds.append(Fold(len(folds), train_start, test_start, _add_months(test_start, test_months)))
+        train_start = _add_months(train_start, test_months)
+    return folds
+
+def company_folds(company, train_months, test_months, timeframe=BASE_TIMEFRAME):
+    """Fold boundaries for one company, read from Parquet statistics without loading bars."""
+    bounds = (
+        pl.scan_parquet(processed_path(company, timeframe))
+        .select(pl.col('datetime').min().alias('first'), pl.col('datetime').max().alias('last'))
+        .collect()
+    )
+    first, last = bounds.row(0)
+    if first is None:
+        return []
+    return compute_folds(first, last, train_months, test_months)
+
+def make_fold_batches(bar_sets, pair_grids, engine_name, train_months, test_months, metric):
+    """
+    One batch per (company, timeframe, fold), carrying every indicator pair and
+    its parameter grid. Folds are computed once per bar set and shared by all pairs.
+    """
+    for company, timeframe in bar_sets:
+        for fold in company_folds(company, train_months, test_months, timeframe):
+            yield engine_name, company, timeframe, fold, pair_grids, metric
+
+def run_fold(args):
+    """
+    Worker entry point for one fold of one company's bars at one timeframe.
+
+    Loads only the fold's date range, then for every indicator pair evaluates
+    each parameter combination on the train window, keeps the best by the
+    selection metric and re-runs it on the unseen test window. Returns one
+    record per pair describing the out-of-sample result. Indicators warm up
+    inside the test window itself, so no train bars leak into its trades.
+    """
+    engine_name, company, timeframe, fold, pair_grids, metric = args
+    engine = ENGINES[engine_name]
+    fold_fields = {
+        'fold': fold.index, 'train_start': fold.train_start,
+        'test_start': fold.test_start, 'test_end': fold.test_end, 'train_score': None,
+    }
+
+    def failed(message, status='SKIPPED'):
+        return [
+            {**fold_fields, **task_record((company, pair, {}, {}, timeframe), status, message)}
+            for pair, _ in pair_grids
+        ]
+
+    data, message = load_processed_data(company, start=fold.train_start, end=fold.test_end, timeframe=timeframe)
+    if message:
+        return failed(message)
+    train = data.filter(pl.col('datetime') < fold.test_start)
+    test = data.filter(pl.col('datetime') >= fold.test_start)
+    if train.is_empty() or test.is_empty():
+        return failed(f"SKIPPED: Fold {fold.index} of {company} has an empty train or test window.")
+
+    try:
+        train_data, test_data = engine.prepare_data(train), engine.prepare_data(test)
+    except Exception as e:
+        return failed(f"ERROR preparing data for {company}: {e}", 'ERROR')
+
+    records = []
+    for pair, combos in pair_grids:
+        best_task, best_score = None, float('-inf')
+        for params1, params2 in combos:
+            task = (company, pair, params1, params2, timeframe)
+            record = engine.run_backtest_task(task, train_data)
+            if record['status'] == 'Completed' and (best_task is None or task_score(record, metric) > best_score):
+                best_task, best_score = task, task_score(record, metric)
+
+        if best_task is None:
+            message = f"ERROR: No parameters for {pair[0]}/{pair[1]} completed on fold {fold.index} of {company}."
+            records.append({**fold_fields, **task_record((company, pair, {}, {}, timeframe), 'ERROR', message)})
+            continue
+
+        record = engine.run_backtest_task(best_task, test_data)
+        records.append({**fold_fields, 'train_score': best_score, **record})
+    return records
+
+def summarize(results_path):
+    """Mean out-of-sample metrics per indicator pair, best first."""
+    return (
+        pl.scan_parquet(results_path)
+        .filter(pl.col('status') == 'Completed')
+        .group_by('timeframe', 'ind1_name', 'ind2_name')
+        .agg(
+            pl.len().alias('folds'),
+            pl.col('pnl').mean().alias('mean_test_pnl'),
+            pl.col('sharpe').mean().alias('mean_test_sharpe'),
+            (pl.col('pnl') > 0).mean().alias('profitable_folds'),
+        )
+        .sort('mean_test_pnl', descending=True)
+        .collect()
+    )
@@ -0,0 +1,56 @@
+import os
+import numpy as np
+import polars as pl
+import pytest
+from src.data_preprocessor import RAW_DATA_DIR, process_all_data, load_processed_data
+
+# Synthetic company the engine checks run on: a few sessions of 5-minute
+# bars, enough to warm up every indicator in the sweep (EMA 200, Ichimoku)
+SYMBOL = 'SYNTH'
+SESSIONS = 4
+BARS_PER_SESSION = 75
+SESSION_OPEN = np.timedelta64(9 * 60 + 15, 'm')
+
+def write_synthetic_csv(path, sessions=SESSIONS, seed=0):
+    """Writes a random-walk 5-minute OHLCV CSV in the raw layout the preprocessor reads."""
+    rng = np.random.default_rng(seed)
+    days = np.busday_offset('2024-01-01', np.arange(sessions), roll='forward').astype('datetime64[m]')
+    minutes = SESSION_OPEN + 5 * np.arange(BARS_PER_SESSION).astype('timedelta64[m]')
+    datetimes = (days[:, None] + minutes[None, :]).ravel().astype('datetime64[us]')
+    n = len(datetimes)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    open_ = np.concatenate(([100.0], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.001, (2, n))) * close
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pl.DataFrame({
+        'Date': datetimes,
+        'Open': open_,
+        'High': np.maximum(open_, close) + spread[0],
+        'Low': np.minimum(open_, close) - spread[1],
+        'Close': close,
+        'Volume': rng.integers(100, 10000, n),
+    }).with_columns(pl.col('Date').dt.strftime('%Y-%m-%d %H:%M:%S')).write_csv(path)
+
+@pytest.fixture(scope='session')
+def company(tmp_path_factory):
+    """
+    Runs the synthetic CSV through the preprocessor inside a scratch
+    directory, which stays the working directory for the session since the
+    pipeline reads relative data/ paths. Yields the company's symbol.
+    """
+    workdir = tmp_path_factory.mktemp('pipeline')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        write_synthetic_csv(os.path.join(RAW_DATA_DIR, f"{SYMBOL}.csv"))
+        process_all_data()
+        yield SYMBOL
+    finally:
+        os.chdir(cwd)
+
+@pytest.fixture(scope='session')
+def data(company):
+    """The synthetic company's processed bars as a Polars frame."""
+    data, message = load_processed_data(company)
+    assert message is None, message
+    return data
@@ -0,0 +1,33 @@
+import numpy as np
+import backtrader as bt
+import pytest
+from src.backtesting_engine import PolarsDataFeed
+from src.custom_indicators import SuperTrend, OnBalanceVolume, VolumeWeightedAveragePrice
+
+# Every custom indicator with the parameter sets the sweep uses
+CHECKS = [
+    (SuperTrend, {'period': 7, 'multiplier': 2.0}),
+    (SuperTrend, {'period': 14, 'multiplier': 3.0}),
+    (OnBalanceVolume, {}),
+    (VolumeWeightedAveragePrice, {}),
+]
+
+class _LineRecorder(bt.Strategy):
+    params = (('indicator', None), ('indicator_params', {}),)
+
+    def __init__(self):
+        self.ind = self.p.indicator(self.datas[0], **self.p.indicator_params)
+
+def _indicator_line(data, indicator, params, runonce):
+    cerebro = bt.Cerebro(stdstats=False, runonce=runonce)
+    cerebro.adddata(PolarsDataFeed(dataname=data))
+    cerebro.addstrategy(_LineRecorder, indicator=indicator, indicator_params=params)
+    strategy = cerebro.run()[0]
+    return np.array(strategy.ind.lines[0].array)
+
+@pytest.mark.parametrize('indicator, params', CHECKS, ids=lambda v: v.__name__ if isinstance(v, type) else str(v))
+def test_next_and_once_agree(data, indicator, params):
+    """The bar-by-bar (next) and batch (once) computations give the same line."""
+    expected = _indicator_line(data, indicator, params, runonce=False)
+    actual = _indicator_line(data, indicator, params, runonce=True)
+    np.testing.assert_array_equal(actual, expected)
@@ -0,0 +1,45 @@
+import math
+from itertools import combinations
+import pytest
+from src.backtesting_engine import backtest_metrics
+from src.vectorized_engine import vectorized_backtest_metrics
+from src.config import INDICATORS, get_param_combinations
+
+# Relative tolerance for floating point metrics (PNL, Sharpe, drawdown)
+TOLERANCE = 1e-6
+
+def _close(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return math.isclose(a, b, rel_tol=TOLERANCE, abs_tol=TOLERANCE)
+
+def _same(expected, actual):
+    return (
+        expected['total_trades'] == actual['total_trades']
+        and expected['wins'] == actual['wins']
+        and expected['losses'] == actual['losses']
+        and _close(expected['final_value'], actual['final_value'])
+        and _close(expected['sharpe'], actual['sharpe'])
+        and _close(expected['max_drawdown'], actual['max_drawdown'])
+    )
+
+@pytest.mark.parametrize('ind1_name, ind2_name', list(combinations(INDICATORS.keys(), 2)))
+def test_engines_agree(data, ind1_name, ind2_name):
+    """Every parameter set of a pair gives the same metrics on both engines."""
+    mismatches = []
+    for p1 in get_param_combinations(ind1_name):
+        for p2 in get_param_combinations(ind2_name):
+            try:
+                expected = backtest_metrics(data, ind1_name, ind2_name, p1, p2)
+            except Exception:
+                # Configurations Backtrader rejects must fail in both engines
+                try:
+                    vectorized_backtest_metrics(data, ind1_name, ind2_name, p1, p2)
+                except Exception:
+                    continue
+                mismatches.append(f"{ind1_name}{p1}/{ind2_name}{p2} only fails in backtrader")
+                continue
+            actual = vectorized_backtest_metrics(data, ind1_name, ind2_name, p1, p2)
+            if not _same(expected, actual):
+                mismatches.append(f"{ind1_name}{p1}/{ind2_name}{p2}: backtrader {expected}, vectorized {actual}")
+    assert not mismatches, '\n'.join(mismatches)
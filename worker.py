@@ -0,0 +1,28 @@
+import argparse
+from src.task_queue import LEASE_SECONDS, default_worker_id, run_worker
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Pull backtest batches from a coordinator's queue (main.py --queue) and push back their results.")
+    parser.add_argument('--queue', required=True, metavar='PATH',
+                        help="SQLite queue file written by the coordinator, e.g. on a shared mount.")
+    parser.add_argument('--worker-id', default=None,
+                        help="Name recorded on leased batches (default: host:pid).")
+    parser.add_argument('--lease-seconds', type=float, default=LEASE_SECONDS,
+                        help="Lease length; renewed every third of it while a batch runs.")
+    parser.add_argument('--poll-seconds', type=float, default=5.0,
+                        help="Wait between checks while other workers hold the remaining batches.")
+    parser.add_argument('--keep-polling', action='store_true',
+                        help="Keep waiting for new batches instead of exiting once the queue is drained.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    worker_id = args.worker_id or default_worker_id()
+    print(f"--- Worker {worker_id} pulling from {args.queue} ---")
+    completed = run_worker(args.queue, worker_id, args.lease_seconds, args.poll_seconds,
+                           exit_when_idle=not args.keep_polling)
+    print(f"--- Worker {worker_id} finished: {completed} batches ---")
+
+if __name__ == '__main__':
+    main()